@@ -0,0 +1,48 @@
+'''
+Memory of list items: per-item dicts vs slotted records on a synthetic library
+run from repository root: python -m benchmarks.records_memory [count]
+'''
+import sys
+import random
+import tracemalloc
+from datetime import datetime
+from commons.records import TorrentItem
+
+STATUSES = ['downloading', 'seeding', 'stopped', 'no torrent']
+EXTS = ['mkv', 'avi', 'mp3', 'flac', 'pdf', None]
+
+def make_fields(i : int) -> dict:
+    return {
+        'id' : i,
+        'hash' : '%040x' % random.getrandbits(160),
+        'name' : 'Some.Torrent.Name.' + str(i) + '.1080p',
+        'percentDone' : random.random(),
+        'status' : random.choice(STATUSES),
+        'size' : random.randint(1 << 20, 1 << 36),
+        'uploadRatio' : random.random() * 5,
+        'date' : datetime.fromtimestamp(1600000000 + i * 60),
+        'is_dir' : i % 3 == 0,
+        'ext' : random.choice(EXTS),
+        'count' : random.randint(1, 30)
+    }
+
+def measure(make, fields : list) -> int:
+    tracemalloc.start()
+    items = [make(f) for f in fields]
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del items
+    return size
+
+def main(count : int = 10000):
+    random.seed(1)
+    fields = [make_fields(i) for i in range(count)]  # values are shared, only containers are measured
+    as_dict = measure(dict, fields)
+    as_record = measure(lambda f: TorrentItem(**f), fields)
+    print('items:', count)
+    print('dict:   %10d bytes, %6.1f per item' % (as_dict, as_dict / count))
+    print('record: %10d bytes, %6.1f per item' % (as_record, as_record / count))
+    print('saved:  %9.1f%%' % (100 - as_record * 100 / as_dict))
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)
@@ -0,0 +1,258 @@
+'''
+End to end benchmarks of hot paths: lists against local fake backends (benchmarks/servers.py)
+and fake Telegram session. Reports p50/p99 latency, CPU time, backend (rpc) and Telegram bytes per round,
+peak memory (tracemalloc, measured in one extra round)
+run from repository root: python -m benchmarks.run [--torrents 10000 --hits 2000 ...] [--json report.json]
+'''
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import argparse
+import tempfile
+import itertools
+import tracemalloc
+from datetime import datetime
+
+import aiohttp
+from aiogram import Bot, methods
+from aiogram.client.session.base import BaseSession
+from aiogram.types import Chat, Message
+
+from .servers import start_backends
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class FakeSession(BaseSession):
+    # Telegram API stand-in: counts calls and request bytes, sent/edited messages are bound to bot
+    def __init__(self) -> None:
+        super().__init__()
+        self.calls = 0
+        self.bytes = 0
+        self.ids = itertools.count(1000)
+
+    async def make_request(self, bot, method, timeout = None):
+        self.calls += 1
+        # size of form fields as aiohttp session would send them
+        for key, value in method.model_dump(warnings = False).items():
+            value = self.prepare_value(value, bot = bot, files = {})
+            if value is not None:
+                self.bytes += len(key) + len(str(value))
+        if isinstance(method, (methods.SendMessage, methods.EditMessageText)):
+            return Message(
+                message_id = getattr(method, 'message_id', None) or next(self.ids), date = datetime.now(),
+                chat = Chat(id = method.chat_id or 1, type = 'private'), text = method.text
+            ).as_(bot)
+        return True
+
+    async def stream_content(self, *args, **kwargs):
+        yield b''
+
+    async def close(self):
+        pass
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+def percentile(values : list, p : float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+def make_download_dir(path : str, entries : int):
+    # entries without torrent: half directories with a few files, half plain files
+    os.makedirs(path)
+    for i in range(entries):
+        if i % 2:
+            os.makedirs(os.path.join(path, 'dir ' + str(i)))
+            for j in range(3):
+                with open(os.path.join(path, 'dir ' + str(i), 'file' + str(j) + '.mkv'), 'wb') as f:
+                    f.write(b'x' * 1024)
+        else:
+            with open(os.path.join(path, 'file ' + str(i) + '.mp3'), 'wb') as f:
+                f.write(b'x' * 2048)
+
+
+class Bench():
+
+    def __init__(self, args, ports : dict, session : FakeSession) -> None:
+        self.args = args
+        self.ports = ports
+        self.session = session
+        self.report = []
+
+    async def backend_bytes(self) -> int:
+        total = 0
+        async with aiohttp.ClientSession() as http:
+            for port in self.ports.values():
+                async with http.get('http://127.0.0.1:' + str(port) + '/_bench/stats') as response:
+                    stats = await response.json()
+                    total += stats['bytes_in'] + stats['bytes_out']
+        return total
+
+    async def measure(self, name : str, fn, rounds : int = None):
+        rounds = rounds or self.args.rounds
+        rpc_bytes = await self.backend_bytes()
+        tg_calls, tg_bytes = self.session.calls, self.session.bytes
+        latencies = []
+        cpu = time.process_time()
+        for _ in range(rounds):
+            start = time.perf_counter()
+            await fn()
+            latencies.append(time.perf_counter() - start)
+        cpu = time.process_time() - cpu
+        rpc_bytes = await self.backend_bytes() - rpc_bytes
+        tg_calls, tg_bytes = self.session.calls - tg_calls, self.session.bytes - tg_bytes
+
+        tracemalloc.start()
+        await fn()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        row = {
+            'name': name,
+            'rounds': rounds,
+            'p50_ms': percentile(latencies, 50) * 1000,
+            'p99_ms': percentile(latencies, 99) * 1000,
+            'cpu_ms': cpu * 1000 / rounds,
+            'rpc_kib': rpc_bytes / 1024 / rounds,
+            'tg_calls': tg_calls / rounds,
+            'tg_kib': tg_bytes / 1024 / rounds,
+            'peak_kib': peak / 1024
+        }
+        self.report.append(row)
+        print('%-40s %6d %9.1f %9.1f %9.1f %10.1f %8.1f %8.1f %10.1f' % tuple(row.values()), flush = True)
+
+
+async def run(args, ports : dict):
+    from commons.globals import settings, transmission_pool, torrents_poller
+    from commons.edit_queue import edit_queue
+    from commons.http_client import close_session
+    from handlers import torrents_list, torrents_find, torrserver
+    from aiogram.fsm.context import FSMContext
+    from aiogram.fsm.storage.memory import MemoryStorage
+    from aiogram.fsm.storage.base import StorageKey
+
+    settings['setup'] = {}  # as bot.py does
+    session = FakeSession()
+    bot = Bot(token = '42:bench', session = session, parse_mode = 'HTML')
+    bench = Bench(args, ports, session)
+    edit_queue.interval = 0
+
+    async def drain():
+        # wait until queued edits are sent
+        while len(edit_queue.workers) > 0:
+            await asyncio.sleep(0.001)
+
+    async def new_message(user : int) -> Message:
+        return await bot.send_message(user, 'list')
+
+    print('%-40s %6s %9s %9s %9s %10s %8s %8s %10s' % ('', 'rounds', 'p50 ms', 'p99 ms', 'cpu ms', 'rpc KiB', 'tg calls', 'tg KiB', 'peak KiB'))
+
+    async def poll_full():
+        for instance in transmission_pool:
+            if instance.snapshot is not None: instance.snapshot.updates = 0
+        await torrents_poller.poll()
+    await bench.measure('transmission poll, full', poll_full, max(args.rounds // 4, 3))
+    await bench.measure('transmission poll, incremental', torrents_poller.poll)
+
+    transmission_list = torrents_list.TransmissionList()
+    async def apply_and_render():
+        transmission_list.apply(torrents_poller.items)
+        await transmission_list.prepare_page()
+        transmission_list.text_and_buttons()
+    await bench.measure('TransmissionList apply + render', apply_and_render)
+
+    async def reload_and_render():
+        await transmission_list.reload(force = True)
+        await transmission_list.prepare_page()
+        transmission_list.text_and_buttons()
+    await bench.measure('TransmissionList reload + render', reload_and_render)
+
+    storage = MemoryStorage()
+    for user in range(1, args.viewers + 1):
+        viewer = torrents_list.TransmissionList()
+        viewer.sort_order = [('date', 0)] if user % 2 else [('size', 0), ('name', 1)]
+        await viewer.reload()
+        viewer.message = await new_message(user)
+        viewer.fsm = FSMContext(storage = storage, key = StorageKey(bot_id = 42, chat_id = user, user_id = user))
+        await viewer.fsm.set_state(torrents_list.ListStates.show_list)
+        torrents_list.user_data[user] = viewer
+    torrents_list.start_polling(bot)  # job is only rescheduled, scheduler is not started
+    async def update_auto():
+        await torrents_list.update_list_auto(bot)
+        await drain()
+    await bench.measure('update_list_auto, ' + str(args.viewers) + ' viewers', update_auto)
+
+    find_list = torrents_find.FindList('matrix', [])
+    find_list.message = await new_message(1)
+    async def find_reload():
+        await find_list.reload(force = True)
+        await drain()
+    await bench.measure('FindList reload (live search)', find_reload)
+
+    async def find_cached():
+        await find_list.reload()
+        await drain()
+    await bench.measure('FindList reload (search cache)', find_cached)
+
+    torrserver_list = torrserver.TorrserverList()
+    async def torrserver_reload():
+        await torrserver_list.reload()
+        torrserver_list.text_and_buttons()
+    await bench.measure('TorrserverList reload + render', torrserver_reload)
+
+    await close_session()
+    return bench.report
+
+def main():
+    parser = argparse.ArgumentParser(description = 'benchmarks of bot hot paths against local fake backends')
+    parser.add_argument('--torrents', type = int, default = 10000)
+    parser.add_argument('--files', type = int, default = 4, help = 'max files per torrent')
+    parser.add_argument('--active', type = float, default = 0.02, help = 'share of downloading torrents')
+    parser.add_argument('--dir-entries', type = int, default = 200, help = 'download_dir entries without torrent')
+    parser.add_argument('--hits', type = int, default = 2000, help = 'search results of all indexers')
+    parser.add_argument('--indexers', type = int, default = 4)
+    parser.add_argument('--torrserver-items', type = int, default = 500)
+    parser.add_argument('--latency', type = float, default = 0.02, help = 'backend latency, seconds (indexer i answers in latency * (i + 1))')
+    parser.add_argument('--viewers', type = int, default = 20, help = 'users watching auto updated list')
+    parser.add_argument('--rounds', type = int, default = 20)
+    parser.add_argument('--json', help = 'write report to file')
+    args = parser.parse_args()
+    if args.json:
+        args.json = os.path.abspath(args.json)
+
+    ports = {'transmission': free_port(), 'jackett': free_port(), 'torrserver': free_port()}
+    backends = start_backends({
+        'torrents': args.torrents, 'files': args.files, 'active': args.active, 'hits': args.hits,
+        'indexers': args.indexers, 'torrserver_items': args.torrserver_items, 'latency': args.latency
+    }, ports)
+
+    workdir = tempfile.mkdtemp(prefix = 'bot-bench-')
+    make_download_dir(os.path.join(workdir, 'downloads'), args.dir_entries)
+    with open(os.path.join(workdir, 'settings.json'), 'w') as f:
+        json.dump({
+            'jackett': {'host': '127.0.0.1', 'port': ports['jackett'], 'api_key': 'bench'},
+            'transmission': {'host': '127.0.0.1', 'port': ports['transmission']},
+            'torrserver': {'host': '127.0.0.1', 'port': ports['torrserver']},
+            'telegram_api_token': '42:bench',
+            'users_list': list(range(1, args.viewers + 1)),
+            'download_dir': os.path.join(workdir, 'downloads')
+        }, f)
+    os.chdir(workdir)  # commons.globals reads settings.json from working directory
+    sys.path.insert(0, REPO)
+    try:
+        report = asyncio.run(run(args, ports))
+    finally:
+        backends.terminate()
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'args': vars(args), 'results': report}, f, indent = 2)
+
+if __name__ == '__main__':
+    main()
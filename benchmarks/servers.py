@@ -0,0 +1,193 @@
+'''
+Local stand-ins of Jackett, Transmission RPC and Torrserver for benchmarks.
+Run in a separate process (start_backends), so their CPU time is not counted as bot's.
+Every server counts requests and bytes: GET /_bench/stats, POST /_bench/reset
+'''
+import random
+import asyncio
+import multiprocessing
+from aiohttp import web
+
+WORDS = ['matrix', 'reloaded', 'revolutions', 'season', 'episode', 'bluray', 'remux', 'web', 'dl', 'hdr', 'extended', 'cut']
+
+def make_title(rnd : random.Random, i : int) -> str:
+    return ' '.join(rnd.choice(WORDS) for _ in range(4)) + ' ' + str(1990 + i % 35) + ' ' + str(i)
+
+def counting_app(routes : list, stats : dict) -> web.Application:
+    @web.middleware
+    async def count(request, handler):
+        body = await request.read()
+        response = await handler(request)
+        if not request.path.startswith('/_bench'):
+            stats['requests'] += 1
+            stats['bytes_in'] += len(body)
+            stats['bytes_out'] += len(response.body) if isinstance(response.body, bytes) else 0
+        return response
+
+    async def get_stats(request):
+        return web.json_response(stats)
+
+    async def reset(request):
+        for key in stats: stats[key] = 0
+        return web.json_response(stats)
+
+    app = web.Application(middlewares = [count])
+    app.add_routes(routes + [web.get('/_bench/stats', get_stats), web.post('/_bench/reset', reset)])
+    return app
+
+def new_stats() -> dict:
+    return {'requests': 0, 'bytes_in': 0, 'bytes_out': 0}
+
+
+class FakeTransmission():
+
+    def __init__(self, torrents : int, files : int, active : float, latency : float, seed : int = 1) -> None:
+        rnd = random.Random(seed)
+        self.latency = latency
+        self.torrents = {}
+        for i in range(torrents):
+            count = rnd.randint(1, files)
+            name = make_title(rnd, i)
+            self.torrents[i + 1] = {
+                'id': i + 1, 'hashString': '%040x' % (i + 1), 'name': name,
+                'percentDone': 1.0, 'status': 6, 'totalSize': rnd.randint(1 << 20, 1 << 34),
+                'uploadRatio': round(rnd.random() * 3, 2), 'addedDate': 1600000000 + i * 600, 'fileCount': count,
+                'files': [{'name': name + '/file' + str(j) + rnd.choice(['.mkv', '.avi', '.mp3']), 'length': 1 << 20, 'bytesCompleted': 1 << 20} for j in range(count)]
+            }
+        self.active = rnd.sample(sorted(self.torrents), int(torrents * active))
+        for id in self.active:
+            self.torrents[id].update(percentDone = 0.0, status = 4)
+        self.removed = []
+        self.stats = new_stats()
+
+    def tick(self):
+        # active torrents progress a bit on every 'recently-active' request
+        for id in self.active:
+            torrent = self.torrents.get(id)
+            if torrent is not None:
+                torrent['percentDone'] = min(1.0, round(torrent['percentDone'] + 0.01, 4))
+
+    def select(self, ids):
+        if ids is None:
+            return list(self.torrents.values())
+        if ids == 'recently-active':
+            return [self.torrents[id] for id in self.active if id in self.torrents]
+        ids = ids if isinstance(ids, list) else [ids]
+        by_hash = set(value for value in ids if isinstance(value, str))
+        return [torrent for torrent in self.torrents.values() if torrent['id'] in ids or torrent['hashString'] in by_hash]
+
+    async def rpc(self, request):
+        if request.headers.get('X-Transmission-Session-Id') != 'bench':
+            return web.Response(status = 409, headers = {'X-Transmission-Session-Id': 'bench'})
+        await asyncio.sleep(self.latency)
+        query = await request.json()
+        method, arguments = query['method'], query.get('arguments', {})
+        result = {}
+        if method == 'session-get':
+            result = {'rpc-version': 17, 'rpc-version-minimum': 14, 'version': '4.0.0'}
+        elif method == 'torrent-get':
+            ids = arguments.get('ids')
+            if ids == 'recently-active':
+                self.tick()
+                result['removed'] = self.removed
+                self.removed = []
+            fields = arguments.get('fields', [])
+            result['torrents'] = [{key: torrent[key] for key in fields if key in torrent} for torrent in self.select(ids)]
+        elif method in ('torrent-start', 'torrent-stop', 'torrent-start-now'):
+            for torrent in self.select(arguments.get('ids')):
+                torrent['status'] = 0 if method == 'torrent-stop' else 6
+        elif method == 'torrent-remove':
+            for torrent in self.select(arguments.get('ids')):
+                del self.torrents[torrent['id']]
+                self.removed.append(torrent['id'])
+        elif method == 'free-space':
+            result = {'path': arguments.get('path'), 'size-bytes': 1 << 40}
+        return web.json_response({'result': 'success', 'arguments': result, 'tag': query.get('tag')})
+
+    def app(self) -> web.Application:
+        return counting_app([web.post('/transmission/rpc', self.rpc)], self.stats)
+
+
+class FakeJackett():
+
+    def __init__(self, hits : int, indexers : int, latency : float, seed : int = 2) -> None:
+        rnd = random.Random(seed)
+        self.latency = latency
+        self.indexers = ['idx' + str(i) for i in range(indexers)]
+        self.results = {indexer: [] for indexer in self.indexers}
+        for i in range(hits):
+            indexer = self.indexers[i % indexers]
+            # every 3rd release is seeded by two indexers (duplicates to merge)
+            release = i if i % 3 else i - 1
+            self.results[indexer].append({
+                'Title': make_title(random.Random(release), release), 'Size': (release + 1) * 1000003, 'TrackerId': indexer, 'Tracker': indexer,
+                'Seeders': rnd.randint(0, 200), 'Peers': rnd.randint(1, 50), 'Link': 'http://jackett/dl/' + indexer + '/' + str(i),
+                'MagnetUri': 'magnet:?xt=urn:btih:%040x' % (release + 1), 'InfoHash': None,
+                'Details': 'http://tracker/details/' + str(i), 'Poster': None, 'PublishDate': '2020-01-01T00:00:00'
+            })
+        self.stats = new_stats()
+
+    async def get_indexers(self, request):
+        return web.json_response([{'id': id, 'name': id.upper(), 'configured': True, 'last_error': ''} for id in self.indexers])
+
+    async def get_results(self, request):
+        indexer = request.match_info['indexer']
+        indexers = [indexer] if indexer in self.results else [id for id in self.indexers if id in request.query.getall('Tracker[]', self.indexers)]
+        # slower indexers answer later
+        await asyncio.sleep(max([self.latency * (1 + self.indexers.index(id)) for id in indexers] or [0]))
+        return web.json_response({'Results': [result for id in indexers for result in self.results[id]], 'Indexers': []})
+
+    async def download(self, request):
+        return web.Response(body = b'd8:announce4:none4:infod4:name' + str(len(request.match_info['n'])).encode() + b':' + request.match_info['n'].encode() + b'ee')
+
+    def app(self) -> web.Application:
+        return counting_app([
+            web.get('/api/v2.0/indexers', self.get_indexers),
+            web.get('/api/v2.0/indexers/{indexer}/results', self.get_results),
+            web.get('/dl/{indexer}/{n}', self.download)
+        ], self.stats)
+
+
+class FakeTorrserver():
+
+    def __init__(self, items : int, latency : float) -> None:
+        self.latency = latency
+        self.items = [{'title': 'item ' + str(i), 'torrent_size': i * 1000, 'hash': '%040x' % i} for i in range(items)]
+        self.stats = new_stats()
+
+    async def torrents(self, request):
+        await asyncio.sleep(self.latency)
+        query = await request.json()
+        if query['action'] == 'list':
+            return web.json_response(self.items)
+        return web.json_response({})
+
+    def app(self) -> web.Application:
+        return counting_app([web.post('/torrents', self.torrents)], self.stats)
+
+
+def serve(config : dict, ports : dict, ready):
+    async def run():
+        backends = {
+            'transmission': FakeTransmission(config['torrents'], config['files'], config['active'], config['latency']),
+            'jackett': FakeJackett(config['hits'], config['indexers'], config['latency']),
+            'torrserver': FakeTorrserver(config['torrserver_items'], config['latency'])
+        }
+        for name, backend in backends.items():
+            runner = web.AppRunner(backend.app(), access_log = None)
+            await runner.setup()
+            await web.TCPSite(runner, '127.0.0.1', ports[name]).start()
+        ready.set()
+        while True:
+            await asyncio.sleep(3600)
+    asyncio.run(run())
+
+def start_backends(config : dict, ports : dict) -> multiprocessing.Process:
+    context = multiprocessing.get_context('spawn')
+    ready = context.Event()
+    process = context.Process(target = serve, args = (config, ports, ready), daemon = True)
+    process.start()
+    if not ready.wait(120):
+        process.terminate()
+        raise RuntimeError('fake backends did not start')
+    return process
@@ -1,22 +1,29 @@
 #!/usr/bin/python3
 import asyncio
 import logging
+from datetime import datetime
 from typing import Any, Callable, Dict, Awaitable
 
 from aiogram import Bot, Dispatcher
-from aiogram.fsm.storage.memory import MemoryStorage
-from aiogram.types import TelegramObject, BotCommand, Message
+from aiogram.types import TelegramObject, BotCommand, CallbackQuery
 from aiogram.dispatcher.middlewares.base import BaseMiddleware
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
 
 from handlers import (
     torrents_find,
     torrents_list,
     torrserver,
     setup_settings,
+    stats,
 )
 
-from commons.globals import settings
-settings['setup'] = {}
+from commons.globals import settings, indexers, scheduler, storage, results_index
+from commons.user_lists import evict_idle, save_all
+from commons.http_client import close_session
+from commons.offload import offload
+from commons.metrics import metrics, serve_metrics
+from commons.webhook import run_webhook
+settings['setup'] = storage.load_setups()
 
 ######################################################################
 class SecurityMiddleware(BaseMiddleware):
@@ -31,6 +38,27 @@ class SecurityMiddleware(BaseMiddleware):
             logging.info('Unknown user: ' + str(user.id))
             return
         return await handler(event, data)
+
+class TimingMiddleware(BaseMiddleware):
+    # latency of handlers, labeled by module and function (callbacks - by FSM state, their functions share a name)
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        callback = data['handler'].callback
+        name = callback.__module__.split('.')[-1] + ':' + (
+            data.get('raw_state') if isinstance(event, CallbackQuery) and data.get('raw_state') else callback.__name__
+        )
+        with metrics.timer('handler', name):
+            return await handler(event, data)
+
+class TelegramTimingMiddleware(BaseRequestMiddleware):
+    # latency of Telegram API calls, labeled by method
+    async def __call__(self, make_request, bot, method):
+        with metrics.timer('telegram', type(method).__name__):
+            return await make_request(bot, method)
 ######################################################################
 
 
@@ -41,26 +69,47 @@ async def main():
     )
 
     bot = Bot(token = settings['telegram_api_token'], parse_mode = 'HTML')
+    bot.session.middleware( TelegramTimingMiddleware() )
     commands = [
         BotCommand(command = cmd, description = dsc) for cmd, dsc in 
         [
             ('list',  'List torrents'),
             ('list_ts',  'List Torrserver'),
-            ('setup', 'Settings setup')
+            ('setup', 'Settings setup'),
+            ('stats', 'Performance stats')
         ]
     ]
     await bot.set_my_commands(commands)
-    await bot.delete_webhook(drop_pending_updates = True)
 
-    dp = Dispatcher( storage = MemoryStorage() )
+    dp = Dispatcher( storage = storage )
     dp.update.outer_middleware( SecurityMiddleware() )
+    dp.message.middleware( TimingMiddleware() )
+    dp.callback_query.middleware( TimingMiddleware() )
     dp.include_routers(
         torrents_list.router,
         torrserver.router,
         setup_settings.router,
+        stats.router,
         torrents_find.router
     )
-    await dp.start_polling(bot)
+    logging.getLogger('apscheduler.executors.default').setLevel(logging.WARNING)
+    scheduler.add_job(indexers.refresh, trigger = 'interval', seconds = indexers.refresh_interval, next_run_time = datetime.now())
+    scheduler.add_job(evict_idle, trigger = 'interval', seconds = 60)
+    scheduler.add_job(offload.run, args = [results_index.compact], kwargs = {'name': 'results_index.compact'}, trigger = 'interval', hours = 1)
+    scheduler.start()
+    if len(torrents_list.notify_users()) > 0:
+        torrents_list.start_polling(bot)  # completion notifications
+    if 'metrics' in settings:
+        await serve_metrics(**{ key: value for key, value in settings['metrics'].items() if key in ('host', 'port') })
+
+    storage.before_close.append(save_all)  # dispatcher closes its storage on shutdown
+    dp.shutdown.register(close_session)
+    dp.shutdown.register(offload.shutdown)
+    if 'webhook' in settings:
+        await run_webhook(dp, bot, **settings['webhook'])
+    else:
+        await bot.delete_webhook(drop_pending_updates = True)
+        await dp.start_polling(bot)
 
 if __name__ == '__main__':
     asyncio.run(main())
\ No newline at end of file
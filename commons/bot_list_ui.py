@@ -9,18 +9,50 @@ from aiogram.types import (
 )
 
 import logging
+from collections import Counter
+from datetime import datetime
+from .edit_queue import edit_queue
+
+class Descending():
+    # inverts order of values that can't be negated (strings...)
+    __slots__ = ('value',)
+
+    def __init__(self, value) -> None:
+        self.value = value
+
+    def __lt__(self, other):
+        return other.value < self.value
+
+    def __eq__(self, other):
+        return self.value == other.value
+
+def sort_key_part(value, order : int) -> tuple:
+    # asc: None goes first, desc: None goes last (as reversed asc)
+    if order == 1:
+        return (value is not None, value)
+    if value is None:
+        return (True, 0)
+    if isinstance(value, (int, float)):
+        return (False, -value)
+    if isinstance(value, datetime):
+        return (False, -value.timestamp())
+    return (False, Descending(value))
 
 class AbstractItemsList():
 
     def __init__(self) -> None:
+        self.view = None      # cached indices of filtered (and sorted) items in items_list
+        self.totals = None    # cached aggregates of filtered items (see accumulate)
         self.items_list = []
         self.sort_keys = []   # enum sortable keys in intems list - ['key1', 'key2'...]
         self.sort_order = []  # [ ('key1' : 0), ('key2' : 1 ) ] # 0 - desc (reversed) 1 - asc (allow multiple key sorting)
 
-        self.filter_key = ''  # items is classified by given key, that allow filter items (todo: multiple keys)
-        self.filter = set()   # set() -- toggle filters by classification (classify_items)
+        self.filter_key = ''  # items is classified by given key (or tuple of keys), that allow filter items
+        self.filter = set()   # set() -- toggle filters by classification (classify_items): any of values of one key, all keys
 
         self.filters_visible = False
+        self.sort_cache = {}        # id(item) -> (item, sort key), keys are reused for unchanged items
+        self.sort_cache_order = None
 
         self.page_num = 0
         self.items_on_page = 4
@@ -30,41 +62,183 @@ class AbstractItemsList():
         self.to_index = -1
         self.reload_button = False
         self.message = None
+        self.rendered_hash = None  # hash of last sent text and markup, unchanged pages are not sent again
+        self.id_keys = ()          # item fields identifying item across reloads (selection, marks)
+        self.multi_select = False  # number buttons mark items for bulk actions instead of selecting
+        self.marked = set()        # item_id of marked items
 
-    def reload(self):
+    async def reload(self, force = False):
         pass
 
-    #@items.setter
-    #def items(self, items_list : list):
-    #    self.items_list = items_list
+    @classmethod
+    def from_state(cls, state : dict):
+        # override when constructor needs arguments kept in state
+        return cls()
+
+    def get_state(self) -> dict:
+        # compact serializable state: enough to rebuild list by from_state and restore
+        return {
+            'sort_order': self.sort_order,
+            'filter': list(self.filter),
+            'filters_visible': self.filters_visible,
+            'page_num': self.page_num,
+            'selected': [self.selected_item[key] for key in self.id_keys] if self.selected_index != -1 else None,
+            'multi_select': self.multi_select,
+            'marked': [list(key) for key in self.marked],
+            'message': [self.message.chat.id, self.message.message_id] if self.message is not None else None
+        }
+
+    async def restore(self, state : dict):
+        self.sort_order = [tuple(entry) for entry in state['sort_order']]
+        self.filter = set(state['filter'])
+        self.filters_visible = state['filters_visible']
+        self.page_num = state['page_num']
+        self.multi_select = state.get('multi_select', False)
+        self.marked = set(tuple(key) for key in state.get('marked', []))
+        await self.reload()
+        self.sort_items()
+        if not self.check_page_bounds(self.page_num):
+            self.page_num = 0
+        if state['selected'] is not None:
+            for i in range(self.count):
+                if [self.item(i)[key] for key in self.id_keys] == state['selected']:
+                    self.selected_index = i
+                    self.selected_item = self.item(i)
+                    break
 
     @property
-    def items(self):
-        return [item for item in self.items_list 
-            if (len(self.filter) == 0) or (
-                len(self.filter) > 0 and item[self.filter_key] in self.filter
-            )
-        ]
+    def items_list(self) -> list:
+        return self._items_list
+
+    @items_list.setter
+    def items_list(self, items_list : list):
+        self._items_list = items_list
+        self.invalidate()
+
+    @property
+    def filter(self) -> set:
+        return self._filter
+
+    @filter.setter
+    def filter(self, filter : set):
+        self._filter = filter
+        self.invalidate()
+
+    def invalidate(self):
+        # drop cached view, call it after changing items_list in place
+        self.view = None
+        self.totals = None
+
+    @property
+    def filter_keys(self) -> tuple:
+        return self.filter_key if isinstance(self.filter_key, tuple) else (self.filter_key,)
+
+    def get_view(self) -> list:
+        if self.view is None:
+            totals = {}
+            view = []
+            # selected values by key, keys without selected values do not filter
+            keys = self.filter_keys
+            if len(self._filter) == 0:
+                selected = []
+            elif len(keys) == 1:
+                selected = [(keys[0], self._filter)]
+            else:
+                selected = [(key, values) for key, values in ((key, set(self.classify_items(key)) & self._filter) for key in keys) if values]
+            for i, item in enumerate(self._items_list):
+                if all(item[key] in values for key, values in selected):
+                    view.append(i)
+                    self.accumulate(totals, item)
+            self.view = view
+            self.totals = totals
+        return self.view
+
+    def accumulate(self, totals : dict, item):
+        # override to collect footer aggregates while view is built
+        pass
+
+    def get_totals(self) -> dict:
+        self.get_view()
+        return self.totals
+
+    @property
+    def count(self) -> int:
+        return len(self.get_view())
+
+    def item(self, i : int):
+        # i - index in filtered list
+        return self._items_list[self.get_view()[i]]
+
+    @property
+    def items(self) -> list:
+        # filtered items, use count and item(i) where possible
+        return [self._items_list[i] for i in self.get_view()]
 
     def sort_items(self) -> list:
-        for key, order in reversed(self.sort_order):
-            self.items_list.sort( key = lambda item: (item[key] is not None, item[key]), reverse = (order == 0) )
+        # single stable sort by composite key of whole sort_order.
+        # Keys are cached by item identity: items have to be replaced, not modified in place, when sort fields change
+        order = tuple(self.sort_order)
+        cache = self.sort_cache if order == self.sort_cache_order else {}
+        new_cache = {}
+        keys = []
+        for item in self.items_list:
+            entry = cache.get(id(item))
+            if entry is None or entry[0] is not item:
+                entry = (item, tuple(sort_key_part(item[key], key_order) for key, key_order in order))
+            new_cache[id(item)] = entry
+            keys.append(entry[1])
+        self.sort_cache = new_cache
+        self.sort_cache_order = order
+        items = self.items_list
+        self.items_list = [items[i] for i in sorted(range(len(items)), key = keys.__getitem__)]
+
+    def item_id(self, item) -> tuple:
+        return tuple(item[key] for key in self.id_keys) if self.id_keys else (id(item),)
 
-    def classify_items(self) -> list:
-        # classify items by key 'filter_key'
-        cls = []
-        key = self.filter_key
+    def update_items(self, updated : list = (), removed : list = ()):
+        # patch affected rows after actions instead of full reload, items are matched by item_id
+        updated = { self.item_id(item): item for item in updated }
+        removed = set(self.item_id(item) for item in removed)
+        items_list = []
         for item in self.items_list:
-            if not item[key] in cls: 
-                cls.append(item[key])
-        return cls
+            key = self.item_id(item)
+            if not key in removed:
+                items_list.append(updated.get(key, item))
+        self.items_list = items_list
+        self.sort_items()
+
+    def get_bulk_actions(self) -> list:
+        # override: [(text, action)] applicable to marked items, enables multi select
+        return []
+
+    async def apply_bulk(self, action : str, items : list):
+        raise NotImplementedError()
+
+    def marked_items(self) -> list:
+        # marked items present in filtered list
+        return [item for item in self.items if self.item_id(item) in self.marked]
+
+    def toggle_multi_select(self):
+        self.multi_select = not self.multi_select
+        self.marked = set()
+
+    def mark_all(self):
+        # toggle: mark every filtered item or clear marks
+        keys = set(self.item_id(item) for item in self.items)
+        self.marked = set() if keys <= self.marked else keys
+
+    def classify_items(self, key : str = None) -> Counter:
+        # count items by every value of 'filter_key' (or of given one of filter keys)
+        key = key or self.filter_keys[0]
+        return Counter(item[key] for item in self.items_list)
 
     def get_item_str(self, i : int) -> str:
         raise NotImplementedError()
 
     def get_header_str(self) -> str:
-        return '<b>results: ' + str(self.from_index + 1) + '-' + str(self.to_index) + ' of ' + str(len(self.items)) +\
-            (' [' + ','.join(self.filter) + ']' if len(self.filter) > 0 else '') +'</b>'
+        return '<b>results: ' + str(self.from_index + 1) + '-' + str(self.to_index) + ' of ' + str(self.count) +\
+            (' [' + ','.join(self.filter) + ']' if len(self.filter) > 0 else '') +\
+            (' marked: ' + str(len(self.marked_items())) if self.multi_select else '') + '</b>'
 
     def get_footer_str(self) -> str:
         return ''
@@ -74,11 +248,11 @@ class AbstractItemsList():
     
     def check_page_bounds(self, page_n) -> bool:
         if page_n < 0: return False
-        if page_n * self.items_on_page >= len(self.items): return False
+        if page_n * self.items_on_page >= self.count: return False
         return True
     
     def set_page_bounds(self) -> bool:
-        max_items = len(self.items)
+        max_items = self.count
         self.from_index = self.page_num * self.items_on_page
         self.to_index = self.from_index + self.items_on_page
         if self.to_index > max_items: self.to_index = max_items
@@ -109,7 +283,23 @@ class AbstractItemsList():
         if footer_str: text = text + hr + footer_str
 
         # number buttons
-        builder.row(*[ InlineKeyboardButton(text = str(i + 1), callback_data = str(i)) for i in page_range ]) 
+        builder.row(*[
+            InlineKeyboardButton(
+                text = ('✓' if self.multi_select and self.item_id(self.item(i)) in self.marked else '') + str(i + 1),
+                callback_data = str(i)
+            ) for i in page_range
+        ])
+
+        # bulk action buttons
+        if self.multi_select:
+            marked_count = len(self.marked_items())
+            builder.row(
+                InlineKeyboardButton(text = 'all', callback_data = 'mark_all'),
+                *[
+                    InlineKeyboardButton(text = text + ' (' + str(marked_count) + ')', callback_data = '#bulk#' + action)
+                    for text, action in self.get_bulk_actions()
+                ] if marked_count > 0 else []
+            )
         
         # sort buttons
         if self.filters_visible and len(self.sort_keys) > 0:
@@ -122,13 +312,13 @@ class AbstractItemsList():
                 row_btns.append( InlineKeyboardButton(text = btn_text, callback_data = '#order_by#' + key ) )
             builder.row(*row_btns) 
 
-        # filter buttons
-        if self.filters_visible and self.filter_key:
+        # filter buttons, row per filter key
+        for filter_key in (self.filter_keys if self.filters_visible and self.filter_key else ()):
             builder.row(*[
                 InlineKeyboardButton(
-                    text = ('✓' if key in self.filter else '') + key, 
+                    text = ('✓' if key in self.filter else '') + key + ' ' + str(count),
                     callback_data = '#filter#' + key
-                ) for key in self.classify_items()
+                ) for key, count in self.classify_items(filter_key).items()
             ])
 
         # page control buttons
@@ -136,19 +326,34 @@ class AbstractItemsList():
             'prev_page': '⬅',
             'next_page': '➡',
             'toggle_filters': '🔺' if self.filters_visible else '🔻',
+            'reload': '🔄',
+            'toggle_multi_select': '☑' if self.multi_select else '☐',
             'dummy': '-'
         }
         btn = { key: InlineKeyboardButton(text = btn_data[key], callback_data = key) for key in btn_data }
         builder.row(
             btn['prev_page'] if self.page_num > 0 else btn['dummy'],
             btn['toggle_filters'],
-            btn['next_page'] if self.page_num + 1 < (len(self.items) / self.items_on_page) else btn['dummy']
+            *([btn['reload']] if self.reload_button else []),
+            *([btn['toggle_multi_select']] if len(self.get_bulk_actions()) > 0 else []),
+            btn['next_page'] if self.page_num + 1 < (self.count / self.items_on_page) else btn['dummy']
         )
         return {'text': text, 'reply_markup': builder.as_markup()}
 
+    @staticmethod
+    def content_hash(content : dict) -> int:
+        return hash((content['text'], content['reply_markup'].model_dump_json()))
+
+    async def prepare_page(self):
+        # override to load lazy details of items on current page before it is rendered
+        pass
+
     async def answer_message(self, message: Message):
+        await self.prepare_page()
+        content = self.text_and_buttons()
         try:
-            self.message = await message.answer(**self.text_and_buttons())
+            self.message = await message.answer(**content)
+            self.rendered_hash = self.content_hash(content)
         except TelegramBadRequest as e:
             logging.info('Message is not modified')
 
@@ -156,17 +361,27 @@ class AbstractItemsList():
         self.selected_index = -1
         if self.message is None:
             return
-        try:
-            await self.message.edit_text(**self.text_and_buttons())
-        except TelegramBadRequest as e:
-            pass
-            # logging.info('Message is not modified')
+        await self.prepare_page()
+        content = self.text_and_buttons()
+        content_hash = self.content_hash(content)
+        if content_hash == self.rendered_hash:
+            return
+        self.rendered_hash = content_hash
+        edit_queue.submit(self.message, content, on_error = lambda: self.edit_failed(content_hash))
+
+    def edit_failed(self, content_hash):
+        # failed page is sent again on next refresh (unless newer one is on the way already)
+        if self.rendered_hash == content_hash:
+            self.rendered_hash = None
 
     async def handle_callback(self, query: CallbackQuery):
         await query.answer(query.data)
-        if query.data in ['next_page', 'prev_page', 'toggle_filters']: 
+        if query.data in ['next_page', 'prev_page', 'toggle_filters', 'toggle_multi_select', 'mark_all']:
             getattr(self, query.data)() # call proper method
 
+        elif query.data == 'reload':
+            await self.reload(force = True)
+
         elif query.data[:10] == '#order_by#':
             key = query.data[10:]
             index = -1
@@ -186,9 +401,19 @@ class AbstractItemsList():
             self.page_num = 0
             self.filter = self.filter ^ set({query.data[8:]})
 
+        elif query.data[:6] == '#bulk#':
+            items = self.marked_items()
+            self.marked = set()
+            self.multi_select = False
+            if len(items) > 0:
+                await self.apply_bulk(query.data[6:], items)
+
+        elif query.data.isdigit() and self.multi_select:
+            self.marked = self.marked ^ set({self.item_id(self.item(int(query.data)))})
+
         elif query.data.isdigit():
             self.selected_index = int(query.data)
-            self.selected_item = self.items[self.selected_index]
+            self.selected_item = self.item(self.selected_index)
             return
 
         await self.refresh()
\ No newline at end of file
@@ -0,0 +1,174 @@
+import os
+import logging
+from collections import Counter
+from datetime import datetime
+from .utils import get_file_ext
+from .records import TorrentItem
+
+try:
+    from inotify_simple import INotify, flags
+except ImportError:
+    INotify = None
+
+
+class DirRecord():
+    # content of one directory (not recursive)
+    __slots__ = ('mtime', 'size', 'ext_counter', 'subdirs')
+
+    def __init__(self, mtime, size, ext_counter, subdirs) -> None:
+        self.mtime = mtime
+        self.size = size
+        self.ext_counter = ext_counter
+        self.subdirs = subdirs
+
+
+class DirIndex():
+    '''
+    Long-lived index of top level entries of download_dir: size, extensions histogram, ctime.
+    Directories are re-read only when they change: by inotify events if inotify_simple
+    is installed, otherwise by directory mtime. Growth of files inside unchanged
+    directories is only seen by inotify, so without it full rescan runs every 'full_every' updates
+    '''
+
+    def __init__(self, root : str, full_every : int = 60, use_inotify : bool = True, instance : str = None) -> None:
+        self.root = root
+        self.instance = instance  # transmission instance downloading here, tag of items
+        self.full_every = full_every
+        self.updates = 0
+        self.dirs = {}       # path -> DirRecord (every directory below root)
+        self.entries = {}    # top level name -> TorrentItem
+        self.root_mtime = None
+        self.dirty = set()   # paths reported by inotify
+        self.watches = {}    # inotify watch descriptor -> path
+        self.inotify = None
+        if use_inotify and INotify is not None:
+            self.inotify = INotify()
+            self.watch_mask = flags.CREATE | flags.DELETE | flags.MODIFY | flags.MOVED_FROM | flags.MOVED_TO | flags.CLOSE_WRITE
+            self.watch(root)
+
+    def watch(self, path : str):
+        try:
+            self.watches[self.inotify.add_watch(path, self.watch_mask)] = path
+        except OSError as e:  # usually fs.inotify.max_user_watches exceeded
+            logging.info('inotify disabled: ' + str(e))
+            self.inotify.close()
+            self.inotify = None
+            self.watches = {}
+
+    def read_events(self) -> bool:
+        # collect changed directories, returns False if events were lost
+        for event in self.inotify.read(timeout = 0):
+            if event.mask & flags.Q_OVERFLOW:
+                return False
+            path = self.watches.get(event.wd)
+            if event.mask & flags.IGNORED:
+                self.watches.pop(event.wd, None)
+            elif path is not None:
+                self.dirty.add(path)
+        return True
+
+    def changed(self, path : str, full : bool):
+        # returns new mtime if directory has to be re-read, otherwise None
+        if not full and self.inotify is not None and path in self.dirs:
+            return self.dirs[path].mtime if path in self.dirty else None
+        mtime = os.stat(path).st_mtime_ns
+        if full or not path in self.dirs or self.dirs[path].mtime != mtime:
+            return mtime
+        return None
+
+    def read_dir(self, path : str, mtime : int):
+        size = 0
+        ext_counter = Counter()
+        subdirs = []
+        with os.scandir(path) as it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks = False):
+                    subdirs.append(entry.path)
+                else:
+                    ext_counter[ get_file_ext(entry.name) ] += 1
+                    size += entry.stat(follow_symlinks = False).st_size
+        old = self.dirs.get(path)
+        if old is not None:
+            for subdir in set(old.subdirs) - set(subdirs):
+                self.drop(subdir)
+        if self.inotify is not None and old is None:
+            self.watch(path)
+        self.dirs[path] = DirRecord(mtime, size, ext_counter, subdirs)
+
+    def update_tree(self, path : str, full : bool) -> bool:
+        # refresh directory subtree, returns True if anything changed
+        try:
+            mtime = self.changed(path, full)
+            if mtime is not None:
+                self.read_dir(path, mtime)
+        except (FileNotFoundError, NotADirectoryError):
+            self.drop(path)
+            return True
+        changed = mtime is not None
+        for subdir in self.dirs[path].subdirs:
+            changed = self.update_tree(subdir, full) or changed
+        return changed
+
+    def drop(self, path : str):
+        record = self.dirs.pop(path, None)
+        if record is not None:
+            for subdir in record.subdirs:
+                self.drop(subdir)
+
+    def aggregate(self, path : str, ext_counter : Counter) -> int:
+        record = self.dirs.get(path)
+        if record is None: return 0
+        ext_counter.update(record.ext_counter)
+        return record.size + sum(self.aggregate(subdir, ext_counter) for subdir in record.subdirs)
+
+    def make_item(self, name : str, is_dir : bool, size : int, ext_counter : Counter, ctime : float) -> TorrentItem:
+        ext = ext_counter.most_common(1)
+        return TorrentItem(
+            status = 'no torrent',
+            name = name,
+            is_dir = is_dir,
+            date = datetime.fromtimestamp(ctime),
+            size = size,
+            ext = ext[0][0] if len(ext) else None,
+            count = ext[0][1] if len(ext) else None,
+            instance = self.instance
+        )
+
+    def update(self) -> dict:
+        full = self.updates % self.full_every == 0
+        self.updates += 1
+        if self.inotify is not None and not self.read_events():
+            full = True
+
+        root_mtime = os.stat(self.root).st_mtime_ns
+        if full or root_mtime != self.root_mtime or self.root in self.dirty:
+            self.root_mtime = root_mtime
+            entries = {}
+            with os.scandir(self.root) as it:
+                for entry in it:
+                    entries[entry.name] = entry.is_dir()
+            for name in set(self.entries) - set(entries):
+                self.drop(os.path.join(self.root, name))
+                del self.entries[name]
+        else:
+            entries = { name: item['is_dir'] for name, item in self.entries.items() }
+
+        for name, is_dir in entries.items():
+            path = os.path.join(self.root, name)
+            try:
+                if is_dir:
+                    if self.update_tree(path, full) or not name in self.entries:
+                        ext_counter = Counter()
+                        size = self.aggregate(path, ext_counter)
+                        self.entries[name] = self.make_item(name, True, size, ext_counter, os.stat(path).st_ctime)
+                else:
+                    st = os.stat(path)
+                    item = self.entries.get(name)
+                    if item is None or item['size'] != st.st_size:
+                        self.entries[name] = self.make_item(name, False, st.st_size, Counter([get_file_ext(name)]), st.st_ctime)
+            except FileNotFoundError:
+                self.drop(path)
+                self.entries.pop(name, None)
+
+        self.dirty.clear()
+        return self.entries
@@ -0,0 +1,50 @@
+import asyncio
+import logging
+from aiogram.exceptions import TelegramAPIError, TelegramBadRequest, TelegramRetryAfter
+from aiogram.types import Message
+
+class EditQueue():
+    '''
+    Per chat queue of message edits. Only the latest content of every message is kept,
+    so bursts of refreshes collapse into one edit. Edits of one chat are spaced
+    by 'interval' seconds, flood control (429) is waited out and the edit retried.
+    Any other error of Telegram skips the edit and calls 'on_error' of it, the worker keeps going
+    '''
+
+    def __init__(self, interval : float = 1.0) -> None:
+        self.interval = interval
+        self.pending = {}   # chat_id -> { message_id: (message, content, on_error) }
+        self.workers = {}   # chat_id -> asyncio.Task
+
+    def submit(self, message : Message, content : dict, on_error = None):
+        chat_id = message.chat.id
+        self.pending.setdefault(chat_id, {})[message.message_id] = (message, content, on_error)
+        if not chat_id in self.workers:
+            self.workers[chat_id] = asyncio.create_task(self.worker(chat_id))
+
+    async def worker(self, chat_id : int):
+        pending = self.pending[chat_id]
+        try:
+            while len(pending) > 0:
+                message_id = next(iter(pending))
+                message, content, on_error = pending.pop(message_id)
+                try:
+                    await message.edit_text(**content)
+                except TelegramRetryAfter as e:
+                    logging.info('Flood control, retry after ' + str(e.retry_after) + 's')
+                    pending.setdefault(message_id, (message, content, on_error))  # unless newer content arrived
+                    await asyncio.sleep(e.retry_after)
+                    continue
+                except TelegramAPIError as e:
+                    # 'message is not modified' means the content is there already
+                    if not (isinstance(e, TelegramBadRequest) and 'not modified' in str(e)):
+                        logging.info('Edit failed: ' + str(e))
+                        if on_error is not None:
+                            on_error()
+                await asyncio.sleep(self.interval)
+        finally:
+            del self.workers[chat_id]
+            del self.pending[chat_id]
+
+
+edit_queue = EditQueue()
@@ -1,10 +1,32 @@
-from transmission_rpc import Client as Transmission
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from .torrserver_api import Torrserver
 from .jackett_api import Jackett
+from .search_cache import SearchCache
+from .torrent_cache import TorrentCache
+from .results_index import ResultsIndex
+from .search_flights import SearchFlights
+from .indexer_registry import IndexerRegistry
+from .transmission_pool import TransmissionPool
+from .torrents_poller import TorrentsPoller
+from .offload import offload
+from .http_client import web_client
+from .poster_resolver import PosterResolver
+from .sqlite_storage import SQLiteStorage
 import json
 
 settings = json.load( open('settings.json') )
+if 'offload' in settings:
+    offload.configure(**settings['offload'])
 
 torrserver = Torrserver(**settings['torrserver'])
-transmission = Transmission(**settings['transmission'])
-jackett = Jackett(**settings['jackett'])
\ No newline at end of file
+transmission_pool = TransmissionPool.from_settings(settings)
+torrents_poller = TorrentsPoller(transmission_pool, **settings.get('polling', {}))
+jackett = Jackett(**settings['jackett'])
+search_cache = SearchCache(**settings.get('search_cache', {}))
+torrent_cache = TorrentCache(**settings.get('torrent_cache', {}))
+results_index = ResultsIndex(**settings.get('results_index', {}))
+search_flights = SearchFlights(jackett, **settings.get('searches', {}))
+indexers = IndexerRegistry(jackett, **settings.get('indexers', {}))
+scheduler = AsyncIOScheduler()
+storage = SQLiteStorage(**settings.get('storage', {}))
+posters = PosterResolver(web_client, storage.path, **settings.get('posters', {}))
\ No newline at end of file
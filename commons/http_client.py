@@ -0,0 +1,113 @@
+import asyncio
+import logging
+import aiohttp
+from .metrics import metrics
+
+_session = None
+
+def get_session() -> aiohttp.ClientSession:
+    # one keep-alive connection pool shared by all backends (created lazily inside running loop)
+    global _session
+    if _session is None or _session.closed:
+        connector = aiohttp.TCPConnector(limit = 64, limit_per_host = 16, keepalive_timeout = 60, ttl_dns_cache = 300)
+        _session = aiohttp.ClientSession(connector = connector)
+    return _session
+
+async def close_session():
+    global _session
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session = None
+
+
+class HttpClient():
+    '''
+    Async http client of a single backend (Jackett, Torrserver, web...)
+    shares pooled session, but has own timeout and concurrency limit
+    '''
+
+    def __init__(self, name : str, timeout : float = 30, limit : int = 4, headers : dict = None) -> None:
+        self.name = name
+        self.timeout = aiohttp.ClientTimeout(total = timeout)
+        self.semaphore = asyncio.Semaphore(limit)
+        self.headers = headers
+
+    async def request(self, method : str, url : str, read : str = 'json', timeout : float = None, max_size : int = None, **kwargs):
+        '''
+        returns decoded body ('json' | 'text' | 'bytes') or None on any failure,
+        'bytes' are streamed by chunks and refused over 'max_size'
+        '''
+        async with self.semaphore:
+            with metrics.timer('backend', self.name) as record:
+                try:
+                    async with get_session().request(
+                        method, url,
+                        headers = self.headers,
+                        timeout = aiohttp.ClientTimeout(total = timeout) if timeout else self.timeout,
+                        **kwargs
+                    ) as response:
+                        if response.status != 200:
+                            logging.info(self.name + ': HTTP ' + str(response.status) + ' ' + url)
+                            record['error'] = True
+                            return None
+                        if read == 'json':
+                            return await response.json(content_type = None)
+                        if read == 'text':
+                            return await response.text()
+                        if max_size is None:
+                            return await response.read()
+                        return await self.read_limited(response, max_size, record)
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    logging.info(self.name + ': ' + (repr(e) if str(e) == '' else str(e)))
+                    record['error'] = True
+                    return None
+
+    async def read_limited(self, response : aiohttp.ClientResponse, max_size : int, record : dict):
+        if (response.content_length or 0) > max_size:
+            logging.info(self.name + ': body is too large ' + str(response.content_length) + ' ' + str(response.url))
+            record['error'] = True
+            return None
+        chunks = []
+        size = 0
+        async for chunk in response.content.iter_chunked(64 * 1024):
+            size += len(chunk)
+            if size > max_size:
+                logging.info(self.name + ': body is too large ' + str(response.url))
+                record['error'] = True
+                return None
+            chunks.append(chunk)
+        return chunks[0] if len(chunks) == 1 else b''.join(chunks)
+
+    async def stream(self, url : str, chunk_size : int = 16 * 1024, timeout : float = None, **kwargs):
+        '''
+        yields body of GET by chunks, nothing on failure. Close it (contextlib.aclosing) when leaving early
+        '''
+        async with self.semaphore:
+            with metrics.timer('backend', self.name) as record:
+                try:
+                    async with get_session().get(
+                        url,
+                        headers = self.headers,
+                        timeout = aiohttp.ClientTimeout(total = timeout) if timeout else self.timeout,
+                        **kwargs
+                    ) as response:
+                        if response.status != 200:
+                            logging.info(self.name + ': HTTP ' + str(response.status) + ' ' + url)
+                            record['error'] = True
+                            return
+                        async for chunk in response.content.iter_chunked(chunk_size):
+                            yield chunk
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    logging.info(self.name + ': ' + (repr(e) if str(e) == '' else str(e)))
+                    record['error'] = True
+
+    async def get(self, url : str, **kwargs):
+        return await self.request('GET', url, **kwargs)
+
+    async def post(self, url : str, **kwargs):
+        return await self.request('POST', url, **kwargs)
+
+
+web_client = HttpClient('web', timeout = 30, limit = 8, headers = {
+    'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10.9; rv:45.0) Gecko/20100101 Firefox/45.0'
+})
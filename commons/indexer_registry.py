@@ -0,0 +1,37 @@
+import time
+import logging
+
+class IndexerRegistry():
+    '''
+    Snapshot of configured Jackett indexers, refreshed in background (see refresh),
+    plus health of every indexer: last error and latency of the last search
+    '''
+
+    def __init__(self, jackett, refresh_interval : float = 600) -> None:
+        self.jackett = jackett
+        self.refresh_interval = refresh_interval
+        self.indexers = []   # configured indexers without errors
+        self.health = {}     # indexer id -> {'name', 'last_error', 'latency', 'updated'}
+        self.loaded = False
+        jackett.registry = self
+
+    async def refresh(self):
+        indexers = await self.jackett.get_indexers()
+        if indexers is None: return  # keep previous snapshot while jackett is unreachable
+        for indexer in indexers:
+            health = self.health.setdefault(indexer['id'], {'latency': None, 'updated': None})
+            health['name'] = indexer['name']
+            health['last_error'] = indexer['last_error']
+        self.indexers = [indexer for indexer in indexers if indexer['last_error'] == '']
+        self.loaded = True
+        logging.info('Jackett indexers: ' + str(len(self.indexers)) + ' of ' + str(len(indexers)))
+
+    async def snapshot(self) -> list:
+        if not self.loaded: await self.refresh()
+        return self.indexers
+
+    def report(self, indexer_id : str, latency : float, error : str = ''):
+        health = self.health.setdefault(indexer_id, {'name': indexer_id})
+        health['latency'] = latency
+        health['last_error'] = error
+        health['updated'] = time.time()
@@ -1,29 +1,77 @@
-import requests
+import asyncio
+import time
 from commons.utils import timestamp
-import logging
+from commons.http_client import HttpClient
 
 class Jackett():
 
-    def __init__(self, host, port, api_key) -> None:
+    def __init__(self, host, port, api_key, timeout = 60, limit = 16, fan_out = True, indexer_timeout = 20) -> None:
         self.api_key = api_key
         self.url = 'http://' + host + ':' + str(port) + '/api/v2.0/'
+        self.http = HttpClient('jackett', timeout, limit)
+        self.fan_out = fan_out                  # query each indexer separately and in parallel
+        self.indexer_timeout = indexer_timeout  # deadline of a single indexer in fan-out mode
+        self.registry = None                    # IndexerRegistry - cached indexers and their health
 
-    def get_valid_indexers(self):
-        response = requests.get(self.url + 'indexers?_=' + timestamp())
-        if response.status_code != 200: return []
-        return [indexer for indexer in response.json() if indexer['configured'] and indexer['last_error'] == '']
-
-    def query(self, query_string : str, trackers : list) -> list:
-        params = {
-            'apikey': self.api_key,
-            'Query' : query_string, 
-            '_' : timestamp()
-        }
-        if len(trackers) > 0:
-            params['Tracker[]'] = trackers
+    async def get_indexers(self):
+        # configured indexers or None if jackett is unreachable
+        indexers = await self.http.get(self.url + 'indexers?_=' + timestamp())
+        if indexers is None: return None
+        return [indexer for indexer in indexers if indexer['configured']]
+
+    async def get_valid_indexers(self):
+        if self.registry is not None:
+            return await self.registry.snapshot()
+        indexers = await self.get_indexers()
+        if indexers is None: return []
+        return [indexer for indexer in indexers if indexer['last_error'] == '']
+
+    async def query(self, query_string : str, trackers : list) -> list:
+        params = [
+            ('apikey', self.api_key),
+            ('Query', query_string),
+            ('_', timestamp())
+        ]
+        params += [('Tracker[]', tracker) for tracker in trackers]
                                             #indexers/<filter>/results  ||| 'indexers/all/results'
-        response = requests.get(self.url + 'indexers/status:healthy,test:passed/results', params)
-        if response.status_code != 200: return []
+        response = await self.http.get(self.url + 'indexers/status:healthy,test:passed/results', params = params)
+        if response is None: return []
+
+        results = response['Results']
+        return results
+
+    async def query_indexer(self, indexer_id : str, query_string : str):
+        '''
+        search single indexer, returns (indexer_id, results), results is None on timeout/error
+        '''
+        params = [
+            ('apikey', self.api_key),
+            ('Query', query_string),
+            ('_', timestamp())
+        ]
+        start = time.monotonic()
+        response = await self.http.get(self.url + 'indexers/' + indexer_id + '/results', params = params, timeout = self.indexer_timeout)
+        if self.registry is not None:
+            self.registry.report(indexer_id, time.monotonic() - start, 'no response' if response is None else '')
+        return indexer_id, (response['Results'] if response is not None else None)
+
+    async def query_stream(self, query_string : str, trackers : list):
+        '''
+        async generator of (indexer_id, results) in order of indexers answers
+        '''
+        if not self.fan_out:
+            yield 'all', await self.query(query_string, trackers)
+            return
+
+        if len(trackers) == 0:
+            trackers = [indexer['id'] for indexer in await self.get_valid_indexers()]
+        tasks = [asyncio.ensure_future(self.query_indexer(indexer_id, query_string)) for indexer_id in trackers]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            for task in tasks: task.cancel()
 
-        results = response.json()['Results']
-        return results
\ No newline at end of file
+    async def download(self, link : str, max_size : int = None):
+        # .torrent file proxied by jackett
+        return await self.http.get(link, read = 'bytes', max_size = max_size)
@@ -0,0 +1,131 @@
+import time
+import threading
+from aiohttp import web
+from contextlib import contextmanager
+from bisect import bisect_left
+
+class Histogram():
+
+    buckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+    def __init__(self) -> None:
+        self.counts = [0] * (len(self.buckets) + 1)  # last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value : float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q : float) -> float:
+        # upper bound of bucket holding the quantile
+        rank = q * self.count
+        total = 0
+        for i, count in enumerate(self.counts):
+            total += count
+            if total >= rank and count > 0:
+                return self.buckets[i] if i < len(self.buckets) else float('inf')
+        return 0.0
+
+
+def escape_label(value : str) -> str:
+    # prometheus text format: backslash, double quote and line feed are escaped in label values
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class Metrics():
+    '''
+    Latency histograms, error counters and in-flight gauges grouped by family
+    ('handler', 'backend', 'telegram', 'offload', 'poll') and name inside family.
+    Thread safe - offloaded code reports here too
+    '''
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.histograms = {}  # (family, name) -> Histogram
+        self.errors = {}      # (family, name) -> int
+        self.in_flight = {}   # (family, name) -> int
+
+    def observe(self, family : str, name : str, seconds : float, error : bool = False):
+        key = (family, name)
+        with self.lock:
+            if not key in self.histograms:
+                self.histograms[key] = Histogram()
+                self.errors[key] = 0
+            self.histograms[key].observe(seconds)
+            if error: self.errors[key] += 1
+
+    @contextmanager
+    def timer(self, family : str, name : str):
+        # with metrics.timer(...) as record: ... record['error'] = True marks failure without exception
+        key = (family, name)
+        record = {'error': False}
+        with self.lock:
+            self.in_flight[key] = self.in_flight.get(key, 0) + 1
+        start = time.perf_counter()
+        try:
+            yield record
+        except Exception:
+            record['error'] = True
+            raise
+        finally:
+            with self.lock:
+                self.in_flight[key] -= 1
+            self.observe(family, name, time.perf_counter() - start, record['error'])
+
+    def prometheus(self) -> str:
+        lines = []
+        with self.lock:
+            families = sorted(set(family for family, _ in self.histograms))
+            for family in families:
+                keys = sorted(key for key in self.histograms if key[0] == family)
+                metric = 'bot_' + family
+                lines.append('# TYPE ' + metric + '_seconds histogram')
+                for key in keys:
+                    hist = self.histograms[key]
+                    label = 'name="' + escape_label(key[1]) + '"'
+                    total = 0
+                    for i, count in enumerate(hist.counts):
+                        total += count
+                        le = str(hist.buckets[i]) if i < len(hist.buckets) else '+Inf'
+                        lines.append(metric + '_seconds_bucket{' + label + ',le="' + le + '"} ' + str(total))
+                    lines.append(metric + '_seconds_sum{' + label + '} ' + str(hist.sum))
+                    lines.append(metric + '_seconds_count{' + label + '} ' + str(hist.count))
+                lines.append('# TYPE ' + metric + '_errors_total counter')
+                for key in keys:
+                    lines.append(metric + '_errors_total{name="' + escape_label(key[1]) + '"} ' + str(self.errors[key]))
+                lines.append('# TYPE ' + metric + '_in_flight gauge')
+                for key in keys:
+                    lines.append(metric + '_in_flight{name="' + escape_label(key[1]) + '"} ' + str(self.in_flight.get(key, 0)))
+        return '\n'.join(lines) + '\n'
+
+    def summary(self) -> str:
+        # short table for /stats: count, errors, average, p50, p99 and in flight now
+        lines = []
+        with self.lock:
+            for key in sorted(self.histograms):
+                hist = self.histograms[key]
+                lines.append(
+                    key[0] + ' ' + key[1] + ': n=' + str(hist.count) +
+                    ' err=' + str(self.errors[key]) +
+                    ' avg=' + str(round(hist.sum / hist.count, 3)) +
+                    ' p50<=' + str(hist.quantile(0.5)) +
+                    ' p99<=' + str(hist.quantile(0.99)) +
+                    (' now=' + str(self.in_flight[key]) if self.in_flight.get(key) else '')
+                )
+        return '\n'.join(lines)
+
+
+metrics = Metrics()
+
+async def serve_metrics(host : str = '127.0.0.1', port : int = 9464):
+    # local prometheus endpoint: http://host:port/metrics
+    async def handle(request):
+        return web.Response(text = metrics.prometheus(), content_type = 'text/plain')
+    app = web.Application()
+    app.router.add_get('/metrics', handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
@@ -0,0 +1,50 @@
+import time
+import asyncio
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+from .metrics import metrics
+
+class Offloader():
+    '''
+    Runs blocking calls off the event loop in a thread pool (rpc, filesystem, parsing).
+    At most 'max_queue' tasks may be queued or running, other callers wait (backpressure)
+    '''
+
+    def __init__(self, threads : int = 8, max_queue : int = 64) -> None:
+        self.configure(threads, max_queue)
+        self.stats = {}  # task name -> {'count', 'errors', 'time', 'max_time', 'wait_time'}
+
+    def configure(self, threads : int = 8, max_queue : int = 64):
+        self.threads = ThreadPoolExecutor(max_workers = threads, thread_name_prefix = 'offload')
+        self.slots = asyncio.Semaphore(max_queue)
+        self.max_queue = max_queue
+        self.queued = 0
+
+    async def run(self, fn, *args, name : str = None, **kwargs):
+        name = name or getattr(fn, '__qualname__', 'task')
+        stats = self.stats.setdefault(name, {'count': 0, 'errors': 0, 'time': 0.0, 'max_time': 0.0, 'wait_time': 0.0})
+        queued_at = time.monotonic()
+        self.queued += 1
+        try:
+            async with self.slots:
+                started = time.monotonic()
+                stats['wait_time'] += started - queued_at
+                try:
+                    with metrics.timer('offload', name):
+                        return await asyncio.get_running_loop().run_in_executor(self.threads, partial(fn, *args, **kwargs))
+                except Exception:
+                    stats['errors'] += 1
+                    raise
+                finally:
+                    elapsed = time.monotonic() - started
+                    stats['count'] += 1
+                    stats['time'] += elapsed
+                    stats['max_time'] = max(stats['max_time'], elapsed)
+        finally:
+            self.queued -= 1
+
+    def shutdown(self):
+        self.threads.shutdown(wait = False, cancel_futures = True)
+
+
+offload = Offloader()
@@ -0,0 +1,120 @@
+import time
+import asyncio
+import logging
+import sqlite3
+from contextlib import aclosing
+from lxml import etree
+from .http_client import HttpClient
+from .offload import offload
+
+def rutracker_poster(element):
+    # aligned poster of the first post, not any image of the page
+    if {'postImg', 'postImgAligned', 'img-right'} <= set((element.get('class') or '').split()):
+        return element.get('title')
+
+def details_table_poster(element):
+    # rutor and alike: first image inside <table id="details">
+    for parent in element.iterancestors('table'):
+        if parent.get('id') == 'details':
+            return element.get('src')
+
+
+class PosterResolver():
+    '''
+    Poster url of tracker details page. Page is streamed and parsed incrementally,
+    parsing stops at the first element matched by rules of the tracker (rules = [(tag, match)]),
+    match(element) returns poster url or None. Resolved urls (and misses) are kept in sqlite for 'ttl' seconds
+    '''
+
+    default_rules = [('var', rutracker_poster), ('img', details_table_poster)]
+
+    def __init__(self, http : HttpClient, path : str = 'bot_state.db', ttl : float = 30 * 86400, prefetch : bool = False) -> None:
+        self.http = http
+        self.ttl = ttl
+        self.prefetch_enabled = prefetch
+        self.rules = {
+            'rutracker': [('var', rutracker_poster)],
+            'rutor': [('img', details_table_poster)]
+        }
+        self.resolving = {}  # details url -> asyncio.Task
+        self.db = sqlite3.connect(path, isolation_level = None)
+        self.db.execute('CREATE TABLE IF NOT EXISTS posters (details TEXT PRIMARY KEY, poster TEXT, updated REAL)')
+
+    def add_rule(self, tracker_id : str, tag : str, match):
+        self.rules.setdefault(tracker_id, []).append((tag, match))
+
+    def cached(self, details : str):
+        # (poster,) if known (poster may be None), None if never resolved
+        row = self.db.execute(
+            'SELECT poster FROM posters WHERE details = ? AND updated > ?', (details, time.time() - self.ttl)
+        ).fetchone()
+        return None if row is None else (row[0] or None,)
+
+    def store(self, details : str, poster : str):
+        self.db.execute('INSERT OR REPLACE INTO posters VALUES (?, ?, ?)', (details, poster or '', time.time()))
+
+    @staticmethod
+    def match(parser : etree.HTMLPullParser, rules : list):
+        for _, element in parser.read_events():
+            for tag, match in rules:
+                if element.tag == tag:
+                    poster = match(element)
+                    if poster:
+                        return poster
+        return None
+
+    @classmethod
+    def feed(cls, parser : etree.HTMLPullParser, rules : list, chunk : bytes):
+        parser.feed(chunk)
+        return cls.match(parser, rules)
+
+    @classmethod
+    def finish(cls, parser : etree.HTMLPullParser, rules : list):
+        # end events of the last elements come out on close only
+        parser.close()
+        return cls.match(parser, rules)
+
+    async def parse(self, details : str, tracker_id : str):
+        # poster url, '' if page has no poster, None if page wasn't loaded
+        rules = self.rules.get(tracker_id, self.default_rules)
+        parser = etree.HTMLPullParser(events = ('end',), tag = list(set(tag for tag, _ in rules)))
+        received = False
+        async with aclosing(self.http.stream(details)) as chunks:
+            async for chunk in chunks:
+                received = True
+                poster = await offload.run(self.feed, parser, rules, chunk, name = 'poster.parse')
+                if poster:
+                    return poster
+        if not received:
+            return None
+        return await offload.run(self.finish, parser, rules, name = 'poster.parse') or ''
+
+    async def resolve(self, details : str, tracker_id : str = None):
+        if not details:
+            return None
+        cached = self.cached(details)
+        if cached is not None:
+            return cached[0]
+        task = self.resolving.get(details)
+        if task is None:
+            task = self.resolving[details] = asyncio.create_task(self.resolve_page(details, tracker_id))
+            task.add_done_callback(lambda _: self.resolving.pop(details, None))
+        return await asyncio.shield(task)
+
+    async def resolve_page(self, details : str, tracker_id : str):
+        try:
+            poster = await self.parse(details, tracker_id)
+        except Exception as e:
+            logging.info('Poster of ' + details + ': ' + str(e))
+            return None
+        if poster is not None:  # don't remember failed loads
+            self.store(details, poster)
+        return poster or None
+
+    def prefetch(self, items : list):
+        # resolve posters of shown items in background, results land in cache
+        if not self.prefetch_enabled:
+            return
+        for item in items:
+            if item['Details'] and not item['Details'] in self.resolving and self.cached(item['Details']) is None:
+                asyncio.create_task(self.resolve(item['Details'], item['TrackerId']))
@@ -0,0 +1,59 @@
+class Record():
+    '''
+    Base of compact list items: fields are __slots__ (no per-item dict),
+    read/write by key (item['name']) is kept, so lists sort and filter records by key names
+    '''
+    __slots__ = ()
+
+    def __init__(self, **fields) -> None:
+        for key in self.__slots__:
+            setattr(self, key, fields.get(key))
+
+    def __getitem__(self, key : str):
+        return getattr(self, key)
+
+    def __setitem__(self, key : str, value):
+        setattr(self, key, value)
+
+    def __contains__(self, key : str) -> bool:
+        return key in self.__slots__
+
+    def get(self, key : str, default = None):
+        return getattr(self, key, default)
+
+    def as_dict(self) -> dict:
+        return { key: getattr(self, key) for key in self.__slots__ }
+
+    def copy(self):
+        return type(self)(**self.as_dict())
+
+    def __repr__(self) -> str:
+        return type(self).__name__ + '(' + ', '.join(key + '=' + repr(getattr(self, key)) for key in self.__slots__) + ')'
+
+
+class TorrentItem(Record):
+    # transmission torrent or download_dir entry without torrent (id is None).
+    # files - count of torrent files; ext, count - most frequent extension and its count, loaded lazily for torrents;
+    # instance - name of transmission instance
+    __slots__ = ('id', 'hash', 'name', 'percentDone', 'status', 'size', 'uploadRatio', 'date', 'is_dir', 'ext', 'count', 'files', 'instance')
+
+
+class FileItem(Record):
+    # file of transmission torrent
+    __slots__ = ('name', 'size', 'percentDone', 'ext')
+
+
+class FindItem(Record):
+    # Jackett search result, field names as in Jackett API
+    __slots__ = (
+        'Title', 'Size', 'TrackerId', 'Seeders', 'Peers', 'Link', 'MagnetUri', 'InfoHash', 'Details', 'Poster',
+        'transmission', 'torrserver', 'alternatives', 'stale'
+    )
+
+    @classmethod
+    def from_jackett(cls, result : dict):
+        return cls(**result, transmission = False, torrserver = False, alternatives = [])
+
+
+class TorrserverItem(Record):
+    __slots__ = ('name', 'size', 'hash')
@@ -0,0 +1,57 @@
+import re
+import base64
+import binascii
+
+btih_re = re.compile(r'xt=urn:btih:([0-9a-zA-Z]+)')
+title_re = re.compile(r'[\W_]+')
+
+def infohash_of(item) -> str:
+    # hex infohash from InfoHash or magnet link (hex or base32 btih), None if unknown
+    value = item['InfoHash']
+    if not value and item['MagnetUri']:
+        match = btih_re.search(item['MagnetUri'])
+        value = match and match.group(1)
+    if not value:
+        return None
+    if len(value) == 32:
+        try:
+            return base64.b32decode(value.upper()).hex()
+        except binascii.Error:
+            return None
+    return value.lower() if len(value) == 40 else None
+
+def title_key(item) -> tuple:
+    return (title_re.sub(' ', item['Title'].lower()).strip(), item['Size'])
+
+
+class ResultMerger():
+    '''
+    Groups copies of one release from different indexers: by infohash, else by normalized title and size.
+    Best seeded copy represents group, others go to its 'alternatives'. Items are added one by one
+    (single pass, works for results streamed by indexers), items() gives groups in order of appearance
+    '''
+
+    def __init__(self) -> None:
+        self.groups = {}  # key -> group number
+        self.best = []    # group number -> best item
+
+    def add(self, item):
+        keys = [key for key in (infohash_of(item), title_key(item)) if key is not None]
+        group = next((self.groups[key] for key in keys if key in self.groups), None)
+        if group is None:
+            group = len(self.best)
+            self.best.append(item)
+        else:
+            best = self.best[group]
+            if item['Seeders'] > best['Seeders']:
+                # new item replaces best one (a new object: sort keys are cached by identity)
+                item['alternatives'] = best['alternatives'] + [best]
+                best['alternatives'] = []
+                self.best[group] = item
+            else:
+                best['alternatives'].append(item)
+        for key in keys:
+            self.groups.setdefault(key, group)
+
+    def items(self) -> list:
+        return list(self.best)
@@ -0,0 +1,108 @@
+import re
+import time
+import sqlite3
+import threading
+from .records import FindItem
+
+word_re = re.compile(r'\w+')
+
+class ResultsIndex():
+    '''
+    Full-text index (sqlite FTS5) of past search results, answers repeated searches at once
+    with stale data while live search runs. Rows older than 'max_age' seconds are dropped,
+    oldest ones also while live data exceeds 'max_bytes', then index is compacted.
+    Blocking - call it by offload
+    '''
+
+    columns = ['Title', 'TrackerId', 'Size', 'Seeders', 'Peers', 'Link', 'MagnetUri', 'InfoHash', 'Details', 'Poster']
+
+    def __init__(self, path : str = 'results.db', max_bytes : int = 64 * 1024 * 1024, max_age : float = 30 * 86400) -> None:
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, isolation_level = None, check_same_thread = False)
+        self.db.executescript('''
+            PRAGMA journal_mode = WAL;
+            PRAGMA synchronous = NORMAL;
+            CREATE TABLE IF NOT EXISTS results (
+                id INTEGER PRIMARY KEY, key TEXT UNIQUE,
+                Title TEXT, TrackerId TEXT, Size INTEGER, Seeders INTEGER, Peers INTEGER,
+                Link TEXT, MagnetUri TEXT, InfoHash TEXT, Details TEXT, Poster TEXT, updated REAL
+            );
+            CREATE INDEX IF NOT EXISTS results_updated ON results (updated);
+            CREATE VIRTUAL TABLE IF NOT EXISTS results_fts USING fts5(
+                Title, content = 'results', content_rowid = 'id', tokenize = 'unicode61 remove_diacritics 2'
+            );
+            CREATE TRIGGER IF NOT EXISTS results_ai AFTER INSERT ON results BEGIN
+                INSERT INTO results_fts (rowid, Title) VALUES (new.id, new.Title);
+            END;
+            CREATE TRIGGER IF NOT EXISTS results_ad AFTER DELETE ON results BEGIN
+                INSERT INTO results_fts (results_fts, rowid, Title) VALUES ('delete', old.id, old.Title);
+            END;
+            CREATE TRIGGER IF NOT EXISTS results_au AFTER UPDATE OF Title ON results BEGIN
+                INSERT INTO results_fts (results_fts, rowid, Title) VALUES ('delete', old.id, old.Title);
+                INSERT INTO results_fts (rowid, Title) VALUES (new.id, new.Title);
+            END;
+        ''')
+
+    @staticmethod
+    def make_key(item) -> str:
+        return item['TrackerId'] + '|' + str(item['Size']) + '|' + item['Title']
+
+    def add(self, items : list):
+        now = time.time()
+        rows = [(self.make_key(item), *(item[column] for column in self.columns), now) for item in items]
+        updates = ', '.join(column + ' = excluded.' + column for column in self.columns[3:] + ['updated'])
+        with self.lock:
+            self.db.execute('BEGIN')
+            self.db.executemany(
+                'INSERT INTO results (key, ' + ', '.join(self.columns) + ', updated) VALUES (' + ', '.join('?' * (len(self.columns) + 2)) + ')'
+                ' ON CONFLICT (key) DO UPDATE SET ' + updates,
+                rows
+            )
+            self.db.execute('COMMIT')
+
+    def search(self, query_string : str, trackers, limit : int = 500) -> list:
+        # items having all words of query, newest first
+        words = word_re.findall(query_string.lower())
+        if len(words) == 0:
+            return []
+        match = ' '.join('"' + word + '"' for word in words)
+        trackers = list(trackers)
+        sql = 'SELECT ' + ', '.join('r.' + column for column in self.columns) + ' FROM results_fts JOIN results r ON r.id = results_fts.rowid' + \
+            ' WHERE results_fts MATCH ? AND r.updated > ?' + \
+            (' AND r.TrackerId IN (' + ', '.join('?' * len(trackers)) + ')' if len(trackers) > 0 else '') + \
+            ' ORDER BY r.updated DESC LIMIT ?'
+        with self.lock:
+            rows = self.db.execute(sql, (match, time.time() - self.max_age, *trackers, limit)).fetchall()
+        return [
+            FindItem(**dict(zip(self.columns, row)), transmission = False, torrserver = False, alternatives = [], stale = True)
+            for row in rows
+        ]
+
+    def used_bytes(self) -> int:
+        page_size, page_count, free_pages = (
+            self.db.execute('PRAGMA ' + pragma).fetchone()[0] for pragma in ('page_size', 'page_count', 'freelist_count')
+        )
+        return page_size * (page_count - free_pages)
+
+    def compact(self):
+        with self.lock:
+            self.db.execute('DELETE FROM results WHERE updated < ?', (time.time() - self.max_age,))
+            while self.used_bytes() > self.max_bytes:
+                count = self.db.execute('SELECT count(*) FROM results').fetchone()[0]
+                if count == 0:
+                    break
+                self.db.execute(
+                    'DELETE FROM results WHERE id IN (SELECT id FROM results ORDER BY updated LIMIT ?)', (max(count // 10, 1),)
+                )
+                self.db.execute("INSERT INTO results_fts (results_fts) VALUES ('optimize')")  # frees pages of deleted rows
+            self.db.execute("INSERT INTO results_fts (results_fts) VALUES ('optimize')")
+            self.db.execute('VACUUM')
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                'rows': self.db.execute('SELECT count(*) FROM results').fetchone()[0],
+                'bytes': self.used_bytes()
+            }
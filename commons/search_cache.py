@@ -0,0 +1,57 @@
+import time
+import json
+from collections import OrderedDict
+from .records import Record
+
+class SearchCache():
+    '''
+    In-process cache of search results keyed by (normalized query, trackers set)
+    entries live 'ttl' seconds, least recently used ones are evicted
+    when 'max_entries' or 'max_bytes' (approximate, by json length) is exceeded
+    '''
+
+    def __init__(self, ttl : float = 600, max_entries : int = 100, max_bytes : int = 32 * 1024 * 1024) -> None:
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # key -> (expires, size, results)
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(query_string : str, trackers) -> tuple:
+        return ' '.join(query_string.lower().split()), frozenset(trackers)
+
+    def get(self, query_string : str, trackers):
+        key = self.make_key(query_string, trackers)
+        entry = self.entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None: self.remove(key)
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return [item.copy() for item in entry[2]]  # items are mutated by lists (flags), give out copies
+
+    def put(self, query_string : str, trackers, results : list):
+        key = self.make_key(query_string, trackers)
+        if key in self.entries: self.remove(key)
+        size = len(json.dumps(results, default = lambda value: value.as_dict() if isinstance(value, Record) else str(value)))
+        if size > self.max_bytes: return
+        self.entries[key] = (time.monotonic() + self.ttl, size, [item.copy() for item in results])
+        self.bytes += size
+        while len(self.entries) > self.max_entries or self.bytes > self.max_bytes:
+            self.remove(next(iter(self.entries)))
+
+    def remove(self, key : tuple):
+        entry = self.entries.pop(key, None)
+        if entry is not None: self.bytes -= entry[1]
+
+    def stats(self) -> dict:
+        return {
+            'entries': len(self.entries),
+            'bytes': self.bytes,
+            'hits': self.hits,
+            'misses': self.misses
+        }
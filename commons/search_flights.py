@@ -0,0 +1,100 @@
+import asyncio
+import logging
+from .jackett_api import Jackett
+from .search_cache import SearchCache
+
+class Flight():
+    # one running search, its batches are replayed to every subscriber
+    def __init__(self) -> None:
+        self.batches = []    # (indexer_id, results)
+        self.done = False
+        self.queued = 0      # searches waiting for a slot when this one was queued, 0 - not queued
+        self.subscribers = 0
+        self.task = None
+        self.changed = asyncio.Event()
+
+    def notify(self):
+        self.changed.set()
+        self.changed = asyncio.Event()
+
+    async def updates(self, on_queued = None):
+        sent = 0
+        notified = False
+        while True:
+            if self.queued and not notified and on_queued is not None:
+                notified = True
+                await on_queued(self.queued)
+            while sent < len(self.batches):
+                sent += 1
+                yield self.batches[sent - 1]
+            if self.done and sent == len(self.batches):
+                return
+            if sent == len(self.batches) and (notified or not self.queued or on_queued is None):
+                await self.changed.wait()
+
+
+class SearchFlights():
+    '''
+    Identical searches (same normalized query and trackers) running at the same time share one Jackett search,
+    at most 'max_searches' Jackett searches run at once, others wait in queue (subscribers get on_queued call).
+    Search is cancelled when its last subscriber leaves
+    '''
+
+    def __init__(self, jackett : Jackett, max_searches : int = 4) -> None:
+        self.jackett = jackett
+        self.slots = asyncio.Semaphore(max_searches)
+        self.flights = {}  # key -> Flight
+        self.waiting = 0
+
+    async def stream(self, query_string : str, trackers, on_queued = None):
+        # same as Jackett.query_stream: yields (indexer_id, results | None)
+        key = SearchCache.make_key(query_string, trackers)
+        flight = self.flights.get(key)
+        if flight is None:
+            flight = self.flights[key] = Flight()
+            flight.task = asyncio.create_task(self.run(key, flight, query_string, trackers))
+        flight.subscribers += 1
+        try:
+            async for batch in flight.updates(on_queued):
+                yield batch
+        finally:
+            flight.subscribers -= 1
+            if flight.subscribers == 0 and not flight.done:
+                flight.task.cancel()
+                if self.flights.get(key) is flight:
+                    del self.flights[key]  # next identical search starts anew
+
+    async def run(self, key : tuple, flight : Flight, query_string : str, trackers):
+        try:
+            if self.slots.locked():
+                self.waiting += 1
+                flight.queued = self.waiting
+                flight.notify()
+                try:
+                    await self.slots.acquire()
+                finally:
+                    self.waiting -= 1
+                flight.queued = 0
+            else:
+                await self.slots.acquire()
+            try:
+                async for batch in self.jackett.query_stream(query_string, trackers):
+                    flight.batches.append(batch)
+                    flight.notify()
+            finally:
+                self.slots.release()
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            logging.info('Search failed: ' + str(e))
+        finally:
+            flight.done = True
+            flight.notify()
+            if self.flights.get(key) is flight:
+                del self.flights[key]
+
+    def stats(self) -> dict:
+        return {
+            'running': len(self.flights) - self.waiting,
+            'queued': self.waiting
+        }
@@ -0,0 +1,83 @@
+import json
+import time
+import sqlite3
+from typing import Any, Dict, Optional
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StorageKey, StateType
+
+class SQLiteStorage(BaseStorage):
+    '''
+    FSM storage in local sqlite file, states and data survive restarts.
+    Same file keeps serialized state of users lists (see UserLists).
+    Dispatcher closes storage first on shutdown, 'before_close' coroutines (saving of lists) run right before it.
+    Used from event loop thread only
+    '''
+
+    def __init__(self, path : str = 'bot_state.db') -> None:
+        self.path = path
+        self.before_close = []
+        self.db = sqlite3.connect(path, isolation_level = None)  # autocommit
+        self.db.execute('PRAGMA journal_mode = WAL')
+        self.db.execute('PRAGMA synchronous = NORMAL')
+        self.db.execute('CREATE TABLE IF NOT EXISTS fsm (key TEXT PRIMARY KEY, state TEXT, data TEXT)')
+        self.db.execute(
+            'CREATE TABLE IF NOT EXISTS lists (user_id INTEGER, kind TEXT, state TEXT, updated REAL, PRIMARY KEY (user_id, kind))'
+        )
+        self.db.execute('CREATE TABLE IF NOT EXISTS setup (user_id INTEGER PRIMARY KEY, data TEXT)')
+
+    @staticmethod
+    def make_key(key : StorageKey) -> str:
+        return ':'.join(str(part) for part in (key.bot_id, key.chat_id, key.user_id, key.thread_id, key.destiny))
+
+    async def set_state(self, key : StorageKey, state : StateType = None) -> None:
+        state = state.state if isinstance(state, State) else state
+        self.db.execute(
+            'INSERT INTO fsm (key, state) VALUES (?, ?) ON CONFLICT (key) DO UPDATE SET state = excluded.state',
+            (self.make_key(key), state)
+        )
+
+    async def get_state(self, key : StorageKey) -> Optional[str]:
+        row = self.db.execute('SELECT state FROM fsm WHERE key = ?', (self.make_key(key),)).fetchone()
+        return row[0] if row else None
+
+    async def set_data(self, key : StorageKey, data : Dict[str, Any]) -> None:
+        self.db.execute(
+            'INSERT INTO fsm (key, data) VALUES (?, ?) ON CONFLICT (key) DO UPDATE SET data = excluded.data',
+            (self.make_key(key), json.dumps(data))
+        )
+
+    async def get_data(self, key : StorageKey) -> Dict[str, Any]:
+        row = self.db.execute('SELECT data FROM fsm WHERE key = ?', (self.make_key(key),)).fetchone()
+        return json.loads(row[0]) if row and row[0] else {}
+
+    def save_list(self, user_id : int, kind : str, state : dict):
+        self.db.execute(
+            'INSERT OR REPLACE INTO lists (user_id, kind, state, updated) VALUES (?, ?, ?, ?)',
+            (user_id, kind, json.dumps(state), time.time())
+        )
+
+    def load_list(self, user_id : int, kind : str) -> Optional[dict]:
+        row = self.db.execute('SELECT state FROM lists WHERE user_id = ? AND kind = ?', (user_id, kind)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def drop_lists(self, max_age : float):
+        # lists nobody touched for 'max_age' seconds can't be restored anymore
+        self.db.execute('DELETE FROM lists WHERE updated < ?', (time.time() - max_age,))
+
+    def save_setup(self, user_id : int, setup : dict):
+        # user settings of /setup, sets are kept as lists
+        data = { key: list(value) if isinstance(value, set) else value for key, value in setup.items() }
+        self.db.execute('INSERT OR REPLACE INTO setup (user_id, data) VALUES (?, ?)', (user_id, json.dumps(data)))
+
+    def load_setups(self) -> dict:
+        result = {}
+        for user_id, data in self.db.execute('SELECT user_id, data FROM setup'):
+            setup = json.loads(data)
+            setup['trackers'] = set(setup.get('trackers', []))
+            result[user_id] = setup
+        return result
+
+    async def close(self) -> None:
+        for callback in self.before_close:
+            await callback()
+        self.db.close()
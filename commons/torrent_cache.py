@@ -0,0 +1,84 @@
+import asyncio
+import hashlib
+from collections import OrderedDict
+
+class TorrentCache():
+    '''
+    Fetched .torrent files, content addressed: every body is stored once by sha1 of content,
+    links (and infohashes) point to it. Least recently used bodies are evicted
+    when 'max_entries' or 'max_bytes' is exceeded, files over 'max_file' are not fetched.
+    Concurrent fetches of the same link share one request
+    '''
+
+    def __init__(self, max_entries : int = 200, max_bytes : int = 32 * 1024 * 1024, max_file : int = 4 * 1024 * 1024) -> None:
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_file = max_file
+        self.bodies = OrderedDict()  # sha1 -> content
+        self.keys = {}               # sha1 -> set of links/infohashes
+        self.aliases = {}            # link or infohash -> sha1
+        self.fetching = {}           # link -> asyncio.Task
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, *keys) -> bytes:
+        for key in keys:
+            digest = self.aliases.get(key)
+            if digest is not None:
+                self.bodies.move_to_end(digest)
+                return self.bodies[digest]
+        return None
+
+    def put(self, content : bytes, *keys):
+        digest = hashlib.sha1(content).hexdigest()
+        if not digest in self.bodies:
+            self.bodies[digest] = content
+            self.keys[digest] = set()
+            self.bytes += len(content)
+        self.bodies.move_to_end(digest)
+        for key in keys:
+            if key and self.aliases.get(key) != digest:
+                self.drop_alias(key)
+                self.aliases[key] = digest
+                self.keys[digest].add(key)
+        while len(self.bodies) > self.max_entries or self.bytes > self.max_bytes:
+            self.remove(next(iter(self.bodies)))
+
+    def drop_alias(self, key):
+        digest = self.aliases.pop(key, None)
+        if digest is not None:
+            self.keys[digest].discard(key)
+
+    def remove(self, digest : str):
+        content = self.bodies.pop(digest)
+        self.bytes -= len(content)
+        for key in self.keys.pop(digest):
+            del self.aliases[key]
+
+    async def fetch(self, link : str, loader, infohash : str = None) -> bytes:
+        '''
+        cached or loaded by 'loader(link, max_size)' coroutine, None on failure
+        '''
+        content = self.get(link, infohash)
+        if content is not None:
+            self.hits += 1
+            if infohash: self.put(content, link, infohash)
+            return content
+        self.misses += 1
+        task = self.fetching.get(link)
+        if task is None:
+            task = self.fetching[link] = asyncio.create_task(loader(link, max_size = self.max_file))
+            task.add_done_callback(lambda _: self.fetching.pop(link, None))
+        content = await asyncio.shield(task)
+        if content:
+            self.put(content, link, infohash)
+        return content
+
+    def stats(self) -> dict:
+        return {
+            'entries': len(self.bodies),
+            'bytes': self.bytes,
+            'hits': self.hits,
+            'misses': self.misses
+        }
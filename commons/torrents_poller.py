@@ -0,0 +1,133 @@
+import time
+import asyncio
+import logging
+import psutil
+from .offload import offload
+from .metrics import metrics
+from .transmission_snapshot import TransmissionSnapshot
+
+class TorrentsPoller():
+    '''
+    Builds one shared snapshot (tuple of items) of torrents of every transmission instance and
+    download_dir entries without torrent. Every viewer of the list
+    sorts/filters/pages the same snapshot, so backends are polled once per tick
+    Items of snapshot are shared - never modify them in place.
+    Instances are polled concurrently and each one merges its part as soon as it answers: poll waits
+    at most 'wait' seconds, a slow instance keeps its previous part meanwhile and raises ('instance', name)
+    event when it comes late. Failed instance keeps its previous part too (see 'errors').
+    'events' are transmission snapshot events plus ('files', None) when download_dir entries change,
+    they pile up (any poll, also by get) until take_events. 'interval' is the pause before next poll:
+    'min_interval' while something downloads or changes, doubled on every quiet poll up to 'max_interval'
+    '''
+
+    active_statuses = TransmissionSnapshot.active_statuses
+    max_events = 1000
+
+    def __init__(self, pool, min_interval : float = 5, max_interval : float = 300, progress_step : float = 0.1, wait : float = 3) -> None:
+        self.pool = pool
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.progress_step = progress_step
+        self.wait = wait
+        self.interval = min_interval
+        self.items = ()
+        self.parts = {}       # instance name -> (torrents, files)
+        self.polling = {}     # instance name -> task of running poll
+        self.waiting = False  # poll waits for instances, parts coming later are late
+        self.errors = {}      # instance name -> error of last poll
+        self.events = []
+        self.active = False
+        self.disk_usage = {}  # total, used, free of download_dirs
+        self.updated = None  # time.monotonic() of last poll
+        self.lock = asyncio.Lock()
+
+    def update(self, instance) -> tuple:
+        # blocking: one instance
+        instance.connect()
+        instance.snapshot.progress_step = self.progress_step
+        label = 'transmission' if len(self.pool) == 1 else 'transmission:' + instance.name
+        with metrics.timer('poll', label):
+            torrents = instance.snapshot.update()
+        files = []
+        if instance.dir_index is not None:
+            with metrics.timer('poll', 'download_dir'):
+                entries = instance.dir_index.update()
+            torrent_names = set(item['name'] for item in torrents)
+            files = [item for name, item in entries.items() if not name in torrent_names]
+            with metrics.timer('poll', 'disk_usage'):
+                usage = psutil.disk_usage(instance.dir_index.root)
+            instance.disk_usage = {'total': usage.total, 'used': usage.used, 'free': usage.free}
+        return torrents, files, instance.snapshot.events
+
+    async def poll_instance(self, instance):
+        try:
+            torrents, files, events = await offload.run(self.update, instance, name = 'poll')
+        except Exception as e:
+            logging.info('Poll of transmission ' + instance.name + ' failed: ' + str(e))
+            self.errors[instance.name] = str(e)
+            return
+        finally:
+            del self.polling[instance.name]
+        self.errors.pop(instance.name, None)
+        previous = self.parts.get(instance.name)
+        # dir index replaces changed entries, so identities tell changes (old part keeps old ids alive)
+        if previous is not None and [id(item) for item in files] != [id(item) for item in previous[1]]:
+            events = events + [('files', None)]
+        if not self.waiting:
+            events = events + [('instance', instance.name)]
+        self.events = (self.events + events)[-self.max_events:]
+        self.parts[instance.name] = (torrents, files)
+        self.merge()
+
+    def merge(self):
+        parts = [self.parts[instance.name] for instance in self.pool if instance.name in self.parts]
+        self.items = tuple(item for torrents, files in parts for item in torrents + files)
+        self.active = any(item['status'] in self.active_statuses for torrents, files in parts for item in torrents)
+        usages = [instance.disk_usage for instance in self.pool if instance.disk_usage]
+        self.disk_usage = { key: sum(usage[key] for usage in usages) for key in ('total', 'used', 'free') } if usages else {}
+
+    def changed(self, instance):
+        # torrents of instance were changed by bot (snapshot fetch/forget): shared snapshot drops stale rows now,
+        # events come with next poll
+        if instance.name in self.parts:
+            with instance.snapshot.lock:
+                torrents = list(instance.snapshot.torrents.values())
+            self.parts[instance.name] = (torrents, self.parts[instance.name][1])
+            self.merge()
+
+    async def update_all(self):
+        for instance in self.pool:
+            if not instance.name in self.polling:
+                self.polling[instance.name] = asyncio.create_task(self.poll_instance(instance))
+        self.waiting = True
+        try:
+            await asyncio.wait(list(self.polling.values()), timeout = self.wait)
+        finally:
+            self.waiting = False
+        self.updated = time.monotonic()
+
+    async def poll(self) -> tuple:
+        async with self.lock:
+            await self.update_all()
+            return self.items
+
+    def take_events(self) -> list:
+        events, self.events = self.events, []
+        return events
+
+    def next_interval(self, events : list) -> float:
+        if self.active or len(events) > 0 or len(self.polling) > 0:
+            self.interval = self.min_interval
+        else:
+            self.interval = min(self.interval * 2, self.max_interval)
+        return self.interval
+
+    def speed_up(self):
+        self.interval = self.min_interval
+
+    async def get(self, max_age : float = 10) -> tuple:
+        # current snapshot if it is fresh enough, otherwise poll (concurrent callers share one poll)
+        async with self.lock:
+            if self.updated is None or time.monotonic() - self.updated >= max_age:
+                await self.update_all()
+            return self.items
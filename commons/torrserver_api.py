@@ -1,4 +1,5 @@
-import requests
+from commons.http_client import HttpClient
+from commons.records import TorrserverItem
 
 class Torrserver():
     '''
@@ -13,10 +14,11 @@ class Torrserver():
     }
     '''
     
-    def __init__(self, host, port) -> None:
+    def __init__(self, host, port, timeout = 10, limit = 4) -> None:
         self.url = 'http://' + host + ':' + str(port) + '/torrents'
+        self.http = HttpClient('torrserver', timeout, limit)
 
-    def add_item(self, item):
+    async def add_item(self, item):
         json = { 
             'action' : 'add',
             'link' : item['Link'] or item['MagnetUri'],
@@ -24,26 +26,26 @@ class Torrserver():
             'poster': item['Poster'],
             'save_to_db': True
         }
-        res = requests.post(self.url, json = json)
-        return res.status_code == 200
+        res = await self.http.post(self.url, json = json, read = 'text')
+        return res is not None
 
-    def remove_item(self, item):
+    async def remove_item(self, item):
         json = { 
             'action' : 'rem',
             'hash' : item['hash']
         }
-        res = requests.post(self.url, json = json)
-        return res.status_code == 200
+        res = await self.http.post(self.url, json = json, read = 'text')
+        return res is not None
 
-    def list_items(self):
-        res = requests.post(self.url, json={'action' : 'list'})
-        if res.status_code != 200:
+    async def list_items(self):
+        res = await self.http.post(self.url, json = {'action' : 'list'})
+        if res is None:
             return []
         result = [
-            { 
-                'name' : item['title'], 
-                'size' : item['torrent_size'] if 'torrent_size' in item else 0, 
-                'hash' : item['hash'] 
-            } for item in res.json()
+            TorrserverItem(
+                name = item['title'],
+                size = item['torrent_size'] if 'torrent_size' in item else 0,
+                hash = item['hash']
+            ) for item in res
         ]
-        return result
\ No newline at end of file
+        return result
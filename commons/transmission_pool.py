@@ -0,0 +1,104 @@
+import os
+import logging
+import threading
+import psutil
+from transmission_rpc import Client
+from .transmission_snapshot import TransmissionSnapshot
+from .dir_index import DirIndex
+
+class TransmissionInstance():
+    # one transmission host: rpc client and snapshot of its torrents (created on first use, a host may be down at start),
+    # index of its download_dir if it is mounted here
+    def __init__(self, name : str, client_args : dict, download_dir : str = None, dir_index_args : dict = {}) -> None:
+        self.name = name
+        self.client_args = client_args
+        self.download_dir = download_dir
+        self.dir_index = None
+        if download_dir and os.path.isdir(download_dir):
+            self.dir_index = DirIndex(download_dir, **dir_index_args, instance = name)
+        self.client = None
+        self.snapshot = None
+        self.disk_usage = {}  # total, used, free of download_dir
+        self.lock = threading.Lock()
+
+    def connect(self):
+        # blocking
+        with self.lock:
+            if self.client is None:
+                self.client = Client(**self.client_args)
+                self.snapshot = TransmissionSnapshot(self.client, instance = self.name)
+
+    def free_space(self) -> int:
+        # blocking: download_dir mounted here or asked by rpc
+        if self.dir_index is not None:
+            return psutil.disk_usage(self.download_dir).free
+        self.connect()
+        return self.client.free_space(self.download_dir or self.client.get_session().download_dir) or 0
+
+    def load(self) -> int:
+        # active torrents by last poll
+        if self.snapshot is None:
+            return 0
+        with self.snapshot.lock:
+            return sum(1 for item in self.snapshot.torrents.values() if item['status'] in TransmissionSnapshot.active_statuses)
+
+
+class TransmissionPool():
+    '''
+    Named transmission instances. Single instance 'default' comes from "transmission" and "download_dir" settings,
+    several ones from "transmission_pool" section: "instances" - {name: client arguments and optional "download_dir"}.
+    New torrents go to instance chosen by "placement": 'free_space' - most free space in download_dir,
+    'load' - fewest active torrents. Unreachable instances are skipped
+    '''
+
+    def __init__(self, instances : list, placement : str = 'free_space') -> None:
+        if not placement in ('free_space', 'load'):
+            raise ValueError('unknown placement: ' + placement)
+        self.instances = instances
+        self.by_name = { instance.name: instance for instance in instances }
+        self.placement = placement
+
+    @classmethod
+    def from_settings(cls, settings : dict):
+        dir_index_args = settings.get('dir_index', {})
+        if not 'transmission_pool' in settings:
+            return cls([TransmissionInstance('default', settings['transmission'], settings['download_dir'], dir_index_args)])
+        instances = []
+        for name, args in settings['transmission_pool']['instances'].items():
+            args = dict(args)
+            download_dir = args.pop('download_dir', None)
+            instances.append(TransmissionInstance(name, args, download_dir, dir_index_args))
+        return cls(instances, settings['transmission_pool'].get('placement', 'free_space'))
+
+    def __getitem__(self, name : str) -> TransmissionInstance:
+        return self.by_name[name]
+
+    def __iter__(self):
+        return iter(self.instances)
+
+    def __len__(self) -> int:
+        return len(self.instances)
+
+    def place(self) -> TransmissionInstance:
+        # blocking
+        if len(self.instances) == 1:
+            return self.instances[0]
+        scores = []
+        for instance in self.instances:
+            try:
+                instance.connect()
+                score = instance.free_space() if self.placement == 'free_space' else -instance.load()
+            except Exception as e:
+                logging.info('Transmission ' + instance.name + ' is skipped: ' + str(e))
+                continue
+            scores.append((score, instance))
+        if len(scores) == 0:
+            raise ConnectionError('no transmission instance is reachable')
+        return max(scores, key = lambda entry: entry[0])[1]
+
+    def add_torrent(self, torrent) -> str:
+        # blocking: .torrent content or magnet link to placed instance, returns its name
+        instance = self.place()
+        instance.connect()
+        instance.client.add_torrent(torrent, download_dir = instance.download_dir)  # none - session default
+        return instance.name
@@ -0,0 +1,179 @@
+import json
+import threading
+from collections import Counter
+from datetime import datetime
+from transmission_rpc.error import TransmissionError
+from transmission_rpc.torrent import get_status_new, get_status_old
+from .utils import get_file_ext
+from .metrics import metrics
+from .records import TorrentItem, FileItem
+
+class TransmissionSnapshot():
+    '''
+    In-memory copy of transmission torrents, updated incrementally:
+    first (and every 'full_every') update fetches all torrents, but only fields the list needs,
+    other updates merge 'recently-active' torrents and drop 'removed' ones.
+    File lists are never polled: file count comes with the list, dominant extension is loaded
+    by details() for rows on screen only and memoized by (hash, file count).
+    Every update leaves 'events' - (kind, item) changes against previous update:
+    added, removed, started, stopped, completed and progress (percentDone crossed a 'progress_step' mark).
+    fetch() and forget() change torrents between updates, their events come with the next update.
+    Poll and details() run in different offload threads: 'lock' guards torrents and files_info, rpc runs outside of it
+    '''
+
+    active_statuses = ('downloading', 'download pending', 'checking', 'check pending')
+    fields = ['id', 'hashString', 'name', 'percentDone', 'status', 'totalSize', 'uploadRatio', 'addedDate', 'fileCount']
+
+    def __init__(self, client, full_every : int = 30, progress_step : float = 0.1, instance : str = None) -> None:
+        self.client = client
+        self.instance = instance  # tag of items
+        self.full_every = full_every
+        self.progress_step = progress_step
+        self.torrents = {}     # id -> item
+        self.files_info = {}   # (hashString, file count) -> (is_dir, ext, count)
+        self.updates = 0
+        self.events = []
+        self.changes = []    # events of fetch() and forget() since last update
+        self.loaded = False  # first update has nothing to compare with
+        self.lock = threading.Lock()
+
+    def torrent_get(self, fields : list, ids = None) -> dict:
+        # raw 'torrent-get': transmission_rpc.Client drops 'removed' list of 'recently-active' answer
+        arguments = {'fields': fields}
+        if ids is not None: arguments['ids'] = ids
+        with metrics.timer('backend', 'transmission'):
+            data = json.loads(self.client._http_query({'method': 'torrent-get', 'arguments': arguments}))
+        if data.get('result') != 'success':
+            raise TransmissionError('torrent-get failed: ' + str(data.get('result')))
+        return data['arguments']
+
+    def get_status(self, code : int) -> str:
+        return get_status_new(code) if self.client.rpc_version >= 14 else get_status_old(code)
+
+    def load_files_info(self, hashes : list) -> dict:
+        ext_counter = Counter()
+        files_info = {}
+        for tr in self.torrent_get(['id', 'hashString', 'fileCount', 'files'], hashes)['torrents']:
+            ext_counter.clear()
+            for file in tr['files']:
+                ext_counter[ get_file_ext(file['name']) ] += 1
+            ext = ext_counter.most_common()
+            files_info[(tr['hashString'], tr.get('fileCount'))] = (
+                len(tr['files']) > 1,
+                ext[0][0] if len(ext) else None,  # most frequent extension (for directory)
+                ext[0][1] if len(ext) else None   # count for frequent extension (for directory)
+            )
+        return files_info
+
+    def make_item(self, tr : dict) -> TorrentItem:
+        files = tr.get('fileCount')  # None before rpc 17, is_dir is known after details() then
+        is_dir, ext, count = self.files_info.get((tr['hashString'], files), ((files or 0) > 1, None, None))
+        return TorrentItem(
+            id = tr['id'],
+            hash = tr['hashString'],
+            name = tr['name'],
+            percentDone = tr['percentDone'],
+            status = self.get_status(tr['status']),
+            size = tr['totalSize'],
+            uploadRatio = tr['uploadRatio'],
+            date = datetime.fromtimestamp(tr['addedDate']),
+            is_dir = is_dir,
+            ext = ext,
+            count = count,
+            files = files,
+            instance = self.instance
+        )
+
+    def item_events(self, old : TorrentItem, new : TorrentItem) -> list:
+        if old is None:
+            return [('added', new)]
+        events = []
+        if old['status'] != new['status']:
+            if new['status'] == 'stopped':
+                events.append(('stopped', new))
+            elif old['status'] == 'stopped':
+                events.append(('started', new))
+        if old['percentDone'] < 1 and new['percentDone'] >= 1:
+            events.append(('completed', new))
+        elif int(new['percentDone'] / self.progress_step) > int(old['percentDone'] / self.progress_step):
+            events.append(('progress', new))
+        return events
+
+    def update(self) -> list:
+        full = len(self.torrents) == 0 or self.updates % self.full_every == 0
+        result = self.torrent_get(self.fields, None if full else 'recently-active')
+        changed = result['torrents']
+        events = []
+        with self.lock:
+            previous = self.torrents
+            if full:
+                self.torrents = {}
+                keys = set((tr['hashString'], tr.get('fileCount')) for tr in changed)
+                self.files_info = { key: value for key, value in self.files_info.items() if key in keys }
+            else:
+                for id in result.get('removed', []):
+                    item = self.torrents.pop(id, None)
+                    if item is not None: events.append(('removed', item))
+            self.updates += 1
+
+            for tr in changed:
+                old = previous.get(tr['id'])
+                item = self.torrents[tr['id']] = self.make_item(tr)
+                events += self.item_events(old, item)
+            if full:
+                events += [('removed', item) for id, item in previous.items() if not id in self.torrents]
+            self.events = self.changes + events if self.loaded else []
+            self.changes = []
+            self.loaded = True
+            return list(self.torrents.values())
+
+    def fetch(self, ids : list) -> list:
+        # re-read given torrents only (right after actions on them)
+        items = []
+        changed = self.torrent_get(self.fields, ids)['torrents']
+        with self.lock:
+            for tr in changed:
+                old = self.torrents.get(tr['id'])
+                item = self.torrents[tr['id']] = self.make_item(tr)
+                self.changes += self.item_events(old, item)
+                items.append(item)
+        return items
+
+    def details(self, items : list) -> list:
+        # items with dominant extension of files (one rpc for those not memoized yet), only changed items are returned
+        items = [item for item in items if item['id'] and item['ext'] is None and item['files'] != 0]
+        with self.lock:
+            missing = [item['hash'] for item in items if not (item['hash'], item['files']) in self.files_info]
+        loaded = self.load_files_info(missing) if len(missing) > 0 else {}
+        result = []
+        with self.lock:
+            self.files_info.update(loaded)
+            for item in items:
+                info = self.files_info.get((item['hash'], item['files']))
+                if info is None:
+                    continue  # file count changed meanwhile (magnet got metadata), next poll tells
+                detailed = item.copy()
+                detailed['is_dir'], detailed['ext'], detailed['count'] = info
+                if self.torrents.get(item['id']) is item:
+                    self.torrents[item['id']] = detailed
+                result.append(detailed)
+        return result
+
+    def files(self, hash : str) -> list:
+        # by hashString, it stays the same across transmission restarts unlike id
+        result = self.torrent_get(['id', 'files'], [hash])['torrents']
+        return [
+            FileItem(
+                name = file['name'],
+                size = file['length'],
+                percentDone = file['bytesCompleted'] / file['length'] if file['length'] else 1,
+                ext = get_file_ext(file['name'])
+            ) for file in (result[0]['files'] if len(result) > 0 else [])
+        ]
+
+    def forget(self, ids : list):
+        # drop torrents removed by bot right away, without waiting for 'removed' in next update
+        with self.lock:
+            for id in ids:
+                item = self.torrents.pop(id, None)
+                if item is not None: self.changes.append(('removed', item))
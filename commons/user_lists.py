@@ -0,0 +1,82 @@
+import time
+from datetime import datetime
+from aiogram import Bot
+from aiogram.types import Chat, Message
+from .sqlite_storage import SQLiteStorage
+
+class UserLists():
+    '''
+    Lists of one kind (handler module) by user. Live lists are kept in memory while used,
+    idle ones are evicted after 'idle' seconds. Compact state of every list (see AbstractItemsList.get_state)
+    is saved to storage and list is rebuilt on demand: button of old message, restart, eviction.
+    Saved states older than 'keep' seconds are dropped
+    '''
+    instances = []
+
+    def __init__(self, kind : str, list_class, storage : SQLiteStorage, idle : float = 1800, keep : float = 7 * 86400) -> None:
+        self.kind = kind
+        self.list_class = list_class
+        self.storage = storage
+        self.idle = idle
+        self.keep = keep
+        self.lists = {}  # user_id -> [items list, last used]
+        UserLists.instances.append(self)
+
+    def __setitem__(self, user_id : int, items_list):
+        self.lists[user_id] = [items_list, time.monotonic()]
+        self.save(user_id)
+
+    def live(self) -> dict:
+        return { user_id: entry[0] for user_id, entry in self.lists.items() }
+
+    def touch(self, user_id : int):
+        # list is used without user actions (auto refresh on screen), it is not idle
+        entry = self.lists.get(user_id)
+        if entry is not None:
+            entry[1] = time.monotonic()
+
+    def save(self, user_id : int):
+        entry = self.lists.get(user_id)
+        if entry is not None:
+            self.storage.save_list(user_id, self.kind, entry[0].get_state())
+
+    async def get(self, user_id : int, bot : Bot = None):
+        # live list or list restored from saved state, None if there is nothing to restore
+        entry = self.lists.get(user_id)
+        if entry is not None:
+            entry[1] = time.monotonic()
+            return entry[0]
+        state = self.storage.load_list(user_id, self.kind)
+        if state is None:
+            return None
+        items_list = self.list_class.from_state(state)
+        if bot is not None and state.get('message') is not None:
+            chat_id, message_id = state['message']
+            items_list.message = Message(
+                message_id = message_id, date = datetime.now(), chat = Chat(id = chat_id, type = 'private')
+            ).as_(bot)
+        await items_list.restore(state)
+        self.lists[user_id] = [items_list, time.monotonic()]
+        return items_list
+
+    def evict(self):
+        expired = time.monotonic() - self.idle
+        for user_id in [user_id for user_id, entry in self.lists.items() if entry[1] < expired]:
+            self.save(user_id)
+            del self.lists[user_id]
+        self.storage.drop_lists(self.keep)
+
+    def save_all(self):
+        for user_id in self.lists:
+            self.save(user_id)
+
+
+# coroutines: storage connection belongs to event loop thread, sync jobs/hooks would run in worker threads
+
+async def evict_idle():
+    for user_lists in UserLists.instances:
+        user_lists.evict()
+
+async def save_all():
+    for user_lists in UserLists.instances:
+        user_lists.save_all()
@@ -1,7 +1,5 @@
 import os
 from datetime import datetime
-import requests
-from lxml import html
 
 def timestamp():
     return str( int(datetime.utcnow().timestamp()) )
@@ -24,9 +22,3 @@ def scantree(path, recursive = False):
         else:
             yield entry
 
-def get_etree(url):
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10.9; rv:45.0) Gecko/20100101 Firefox/45.0'
-    }
-    content = requests.get(url, headers = headers)
-    return html.fromstring(content.text)
\ No newline at end of file
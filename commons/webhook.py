@@ -0,0 +1,91 @@
+import ssl
+import signal
+import asyncio
+import logging
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.types import FSInputFile
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+
+class DrainingRequestHandler(SimpleRequestHandler):
+    # updates are handled in background; while not accepting (starting, draining) Telegram gets 503 and redelivers later
+
+    def __init__(self, dispatcher : Dispatcher, bot : Bot, **kwargs) -> None:
+        super().__init__(dispatcher = dispatcher, bot = bot, **kwargs)
+        self.accepting = False
+
+    async def handle(self, request : web.Request) -> web.Response:
+        if not self.accepting:
+            return web.Response(status = 503, text = 'not ready')
+        return await super().handle(request)
+
+    async def drain(self, timeout : float):
+        # stop taking updates and wait for handlers in flight
+        self.accepting = False
+        tasks = set(self._background_feed_update_tasks)
+        if len(tasks) == 0:
+            return
+        logging.info('Draining ' + str(len(tasks)) + ' updates')
+        done, pending = await asyncio.wait(tasks, timeout = timeout)
+        if len(pending) > 0:
+            logging.info('Drain timeout, ' + str(len(pending)) + ' updates are cancelled')
+            for task in pending:
+                task.cancel()
+            await asyncio.wait(pending)
+
+
+async def run_webhook(
+    dispatcher : Dispatcher, bot : Bot, url : str = None, host : str = '0.0.0.0', port : int = 8443, path : str = '/webhook',
+    secret_token : str = None, certificate : str = None, private_key : str = None, drain_timeout : float = 30
+):
+    '''
+    Receives updates by webhook on embedded aiohttp server instead of long polling, runs until SIGINT/SIGTERM.
+    url - public base url registered at Telegram (path is appended), none - webhook is not registered (local testing).
+    certificate, private_key - pem files for TLS, certificate is uploaded to Telegram (self-signed one is fine).
+    GET /healthz answers while process runs, GET /readyz - while updates are accepted.
+    On stop updates are refused, handlers in flight get 'drain_timeout' seconds, then dispatcher shutdown handlers run
+    '''
+    handler = DrainingRequestHandler(dispatcher, bot, secret_token = secret_token)
+    app = web.Application()
+    setup_application(app, dispatcher, bot = bot)
+    handler.register(app, path = path)
+
+    async def healthz(request):
+        return web.Response(text = 'ok')
+
+    async def readyz(request):
+        return web.Response(text = 'ready') if handler.accepting else web.Response(status = 503, text = 'not ready')
+
+    app.router.add_get('/healthz', healthz)
+    app.router.add_get('/readyz', readyz)
+
+    ssl_context = None
+    if certificate and private_key:
+        ssl_context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+        ssl_context.load_cert_chain(certificate, private_key)
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    runner = web.AppRunner(app)
+    await runner.setup()  # dispatcher startup handlers run here
+    try:
+        await web.TCPSite(runner, host, port, ssl_context = ssl_context).start()
+        if url:
+            # pending updates are kept: ones refused while restarting come back
+            await bot.set_webhook(
+                url.rstrip('/') + path,
+                certificate = FSInputFile(certificate) if certificate else None,
+                secret_token = secret_token,
+                allowed_updates = dispatcher.resolve_used_update_types()
+            )
+        handler.accepting = True
+        logging.info('Webhook server is listening on ' + host + ':' + str(port) + path)
+        await stop.wait()
+        await handler.drain(drain_timeout)
+    finally:
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.remove_signal_handler(sig)
+        await runner.cleanup()  # dispatcher shutdown handlers, bot session is closed
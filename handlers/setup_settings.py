@@ -1,8 +1,7 @@
-import requests
-
 from commons.aio_modules import *
 from commons.utils import datetime, timestamp
-from commons.globals import settings, jackett
+from commons.globals import settings, indexers, storage
+from handlers.torrents_list import start_polling
 
 router = Router()
 
@@ -10,42 +9,58 @@ class Setup(StatesGroup):
     begin = State()
     setup_trackers = State()
 
-def setup_tracker_buttons(setup_map):
-    indexers = jackett.get_valid_indexers()
+def latency_str(indexer_id):
+    latency = indexers.health.get(indexer_id, {}).get('latency')
+    return ' (' + str(round(latency, 1)) + 's)' if latency is not None else ''
+
+async def setup_tracker_buttons(setup_map):
     builder = InlineKeyboardBuilder()
-    for text, data in [ ( ('✓' if ind['id'] in setup_map else '') + ind['name'], ind['id']) for ind in indexers ]:
+    for text, data in [ ( ('✓' if ind['id'] in setup_map else '') + ind['name'] + latency_str(ind['id']), ind['id']) for ind in await indexers.snapshot() ]:
         builder.row(InlineKeyboardButton(text = text, callback_data = data))
     builder.row(InlineKeyboardButton(text='--------Ok--------', callback_data = 'ok'))
     return builder.as_markup()
 
+def user_setup(user : int) -> dict:
+    # buttons of /setup message sent before restart may come first
+    return settings['setup'].setdefault(user, {
+        'trackers' : set(),
+        'notify' : False
+    })
+
+def setup_buttons(setup_map):
+    builder = InlineKeyboardBuilder()
+    notify = ('☑' if setup_map.get('notify') else '☐') + ' Notify on complete'
+    row_btns = (InlineKeyboardButton(text=text, callback_data=data) for text, data in  [('Trackers', 'trackers'), (notify, 'notify')] )
+    builder.row(*row_btns)
+    return builder.as_markup()
+
 @router.message(Command('setup'))
 async def cmd_setup(message: Message, state: FSMContext):
     await state.clear()
     await state.set_state(Setup.begin)
     user = message.from_user.id
-
-    setup = settings['setup']
-    if not user in setup:
-        setup[user] = {
-            'trackers' : set()
-        }
-
-    builder = InlineKeyboardBuilder()
-    row_btns = (InlineKeyboardButton(text=text, callback_data=data) for text, data in  [('Trackers', 'trackers')] )
-    builder.row(*row_btns)
-    await message.reply('Settings:', reply_markup = builder.as_markup())
+    await message.reply('Settings:', reply_markup = setup_buttons(user_setup(user)))
 
 @router.callback_query(StateFilter(Setup.begin))
 async def inline_kb_answer_callback_handler(query: CallbackQuery, state: FSMContext):
     await query.answer()
     user = query.from_user.id
-    setup = settings['setup']
+    setup = user_setup(user)
 
     if query.data == 'trackers':
-        keyboard = setup_tracker_buttons(setup[user]['trackers'])
+        keyboard = await setup_tracker_buttons(setup['trackers'])
         await state.set_state(Setup.setup_trackers)
         await query.bot.send_message(user, '------[Select tracker]------', reply_markup = keyboard )
         return
+
+    if query.data == 'notify':
+        # completion notifications come from polling of torrents list
+        setup['notify'] = not setup.get('notify')
+        storage.save_setup(user, setup)
+        if setup['notify']:
+            start_polling(query.bot)
+        await query.bot.edit_message_reply_markup(query.message.chat.id, query.message.message_id, reply_markup = setup_buttons(setup))
+        return
     
     await query.bot.send_message(user, 'Confirmed!', reply_markup = ReplyKeyboardRemove() )
     await state.clear()
@@ -53,15 +68,16 @@ async def inline_kb_answer_callback_handler(query: CallbackQuery, state: FSMCont
 @router.callback_query(StateFilter(Setup.setup_trackers))
 async def inline_kb_answer_callback_handler(query: CallbackQuery, state: FSMContext):
     await query.answer()
-    setup = settings['setup']
     user = query.from_user.id
+    setup = user_setup(user)
 
     if query.data == 'ok':
         await query.bot.send_message(user, 'Confirmed!', reply_markup = ReplyKeyboardRemove() )
         await state.clear()
         return
 
-    setup[user]['trackers'] = setup[user]['trackers'] ^ set({query.data})
+    setup['trackers'] = setup['trackers'] ^ set({query.data})
+    storage.save_setup(user, setup)
 
-    keyboard = setup_tracker_buttons(setup[user]['trackers'])
+    keyboard = await setup_tracker_buttons(setup['trackers'])
     await query.bot.edit_message_reply_markup(query.message.chat.id, query.message.message_id, reply_markup = keyboard)
\ No newline at end of file
@@ -0,0 +1,27 @@
+from html import escape
+
+from commons.aio_modules import *
+from commons.metrics import metrics
+from commons.offload import offload
+from commons.globals import settings, search_cache, torrent_cache, results_index, search_flights, transmission_pool, torrents_poller
+
+router = Router()
+
+@router.message(Command('stats'))
+async def cmd_stats(message: Message):
+    if message.from_user.id not in settings.get('metrics', {}).get('admins', settings['users_list']):
+        return
+    lines = [
+        metrics.summary() or 'no data yet',
+        '',
+        'search cache: ' + ', '.join(key + '=' + str(value) for key, value in search_cache.stats().items()),
+        'torrent cache: ' + ', '.join(key + '=' + str(value) for key, value in torrent_cache.stats().items()),
+        'searches: ' + ', '.join(key + '=' + str(value) for key, value in search_flights.stats().items()),
+        'results index: ' + ', '.join(key + '=' + str(value) for key, value in results_index.stats().items()),
+        'transmission: ' + ', '.join(
+            instance.name + '=' + ('polling' if instance.name in torrents_poller.polling else torrents_poller.errors.get(instance.name, 'ok'))
+            for instance in transmission_pool
+        ),
+        'offload queued: ' + str(offload.queued) + ' of ' + str(offload.max_queue)
+    ]
+    await message.answer('<pre>' + escape('\n'.join(lines)) + '</pre>')
@@ -1,13 +1,16 @@
+import asyncio
 import logging
-import requests
-from io import BytesIO
 
 from commons.aio_modules import *
 from commons.bot_list_ui import AbstractItemsList
-from commons.utils import timestamp, sizeof_fmt, get_etree
-from commons.globals import settings, transmission, torrserver, jackett
+from commons.records import FindItem
+from commons.result_merger import ResultMerger
+from commons.utils import timestamp, sizeof_fmt
+from commons.offload import offload
+from commons.user_lists import UserLists
+from commons.globals import settings, transmission_pool, torrserver, jackett, search_cache, torrent_cache, results_index, search_flights, storage, posters
+from handlers.torrents_list import start_polling
 
-user_data = {}
 router = Router()
 
 class FindList(AbstractItemsList):
@@ -17,26 +20,127 @@ class FindList(AbstractItemsList):
         self.sort_keys = [('Size', 'size'), ('Seeders', 'seeds'), ('Peers', 'peers'), ('Link', 'lnk')]
         self.sort_order = [('Size', 0), ('Seeders', 0), ('Peers', 0)]
         self.filter_key = 'TrackerId'
+        self.reload_button = True
         self.query_string = query_string
         self.trackers = trackers
-        self.reload()
-
-    def reload(self):
-        results = jackett.query(self.query_string, self.trackers)
-        self.items_list = [el for el in results if el['Seeders'] > 0 or el['Peers'] > 0]
-        for item in self.items_list:
-            item['transmission'] = False
-            item['torrserver'] = False
+        self.timed_out = []  # indexers failed to answer in time
+        self.searching = False
+        self.queued = False     # waits for free search slot
+        self.cancelled = False  # replaced by newer search of user
+        self.id_keys = ('TrackerId', 'Title', 'Size')
+
+    @classmethod
+    def from_state(cls, state : dict):
+        return cls(state['query_string'], state['trackers'])
+
+    def get_state(self) -> dict:
+        return {
+            **super().get_state(),
+            'query_string': self.query_string,
+            'trackers': list(self.trackers)
+        }
+
+    async def reload(self, force = False):
+        await self.search(force = force)
+
+    async def search(self, message : Message = None, force = False):
+        # partial results are rendered as soon as the first indexers answer,
+        # the rest of them edit the same message in place
+        self.timed_out = []
+        self.cancelled = False
+        cached = None if force else search_cache.get(self.query_string, self.trackers)
+        if cached is not None:
+            self.items_list = cached
+            self.sort_items()
+            await self.show(message)
+            return
+
+        # past results from local index are shown at once, replaced tracker by tracker with live ones
+        stale = ResultMerger()
+        for item in await offload.run(results_index.search, self.query_string, self.trackers, name = 'results_index.search'):
+            stale.add(item)
+        self.items_list = stale.items()
         self.sort_items()
+        self.searching = True
+        if self.count > 0:
+            await self.show(message)
+
+        async def on_queued(waiting : int):
+            self.queued = True
+            if self.message is not None:
+                await self.refresh()
+            elif message is not None:
+                await message.reply('Search is queued (' + str(waiting) + ' waiting)...')
+
+        merger = ResultMerger()
+        answered = set()
+        try:
+            async for indexer_id, results in search_flights.stream(self.query_string, self.trackers, on_queued):
+                self.queued = False
+                self.add_results(merger, stale, answered, indexer_id, results)
+                await self.show(message)
+        except asyncio.CancelledError:
+            self.searching = False
+            self.cancelled = True
+            await self.refresh()
+            raise
+        self.searching = False
+        live = merger.items()
+        if len(live) > 0:
+            await offload.run(results_index.add, [copy for item in live for copy in [item, *item['alternatives']]], name = 'results_index.add')
+        if len(self.timed_out) == 0 and len(answered) > 0:  # don't cache incomplete results
+            search_cache.put(self.query_string, self.trackers, self.items_list)
+        await self.refresh()
+
+    def add_results(self, merger : ResultMerger, stale : ResultMerger, answered : set, indexer_id : str, results : list):
+        if results is None:
+            self.timed_out.append(indexer_id)
+            return
+        answered.add(indexer_id)
+        for item in results:
+            if item['Seeders'] > 0 or item['Peers'] > 0:
+                merger.add(FindItem.from_jackett(item))
+        self.items_list = merger.items() + [
+            item for item in stale.items() if not (item['TrackerId'] in answered or 'all' in answered)
+        ]
+        self.sort_items()
+
+    async def show(self, message : Message = None):
+        if self.message is not None:
+            await self.refresh()
+        elif message is not None and len(self.items_list) > 0:
+            await self.answer_message(message)
+
+    def text_and_buttons(self) -> dict:
+        content = super().text_and_buttons()
+        posters.prefetch([self.item(i) for i in range(self.from_index, self.to_index)])
+        return content
+
+    def get_header_str(self) -> str:
+        return super().get_header_str() + \
+            (' <i>queued...</i>' if self.queued else ' <i>searching...</i>' if self.searching else '') + \
+            (' <i>cancelled</i>' if self.cancelled else '') + \
+            (' <i>timeout: ' + ','.join(self.timed_out) + '</i>' if len(self.timed_out) > 0 else '')
 
     def get_item_str(self, i : int):
-        item = self.items[i]
+        item = self.item(i)
         return '<b>' + str(i + 1) + '.</b> ' + item['Title'] + \
-            ' [' + sizeof_fmt(item['Size']) + '] [' + item['TrackerId'] + ']' + \
+            ' [' + sizeof_fmt(item['Size']) + '] [' + item['TrackerId'] +\
+            (' +' + str(len(item['alternatives'])) if item['alternatives'] else '') + ']' + \
             ' [' +str(item['Seeders']) + 's/' + str(item['Peers']) + 'p]' +\
             (' [downloading]' if item['transmission'] else '') +\
-            (' [in torrserver]' if item['torrserver'] else '')
+            (' [in torrserver]' if item['torrserver'] else '') +\
+            (' <i>[stale]</i>' if item['stale'] else '')
+
+    def get_selected_str(self) -> str:
+        return super().get_selected_str() + ''.join(
+            '\nalso: ' + item['TrackerId'] + ' [' + str(item['Seeders']) + 's/' + str(item['Peers']) + 'p]'
+            for item in self.selected_item['alternatives']
+        )
+
 
+user_data = UserLists('find', FindList, storage, **settings.get('user_lists', {}))
+searches = {}  # user -> running search task, newer query of user cancels it
 
 class FindStates(StatesGroup):
     show_list = State()
@@ -49,20 +153,36 @@ async def process_find(message: Message, state: FSMContext):
     user = message.from_user.id
     trackers_setup = settings['setup'][user]['trackers'] if user in settings['setup'] else set({})
     find_list = FindList(message.text, list(trackers_setup))
-    logging.info(str(user) + ', ' + message.text + ', found:' + str(len(find_list.items)) + '')
-    if len(find_list.items) == 0:
-        await message.reply('Nothing found...')
-        await state.clear()
-        return
-
-    await find_list.answer_message(message)
-    await state.set_state(FindStates.show_list)
     user_data[message.from_user.id] = find_list
+    await state.set_state(FindStates.show_list)
+    if user in searches:
+        searches[user].cancel()
+    task = searches[user] = asyncio.create_task(find_list.search(message))
+    try:
+        await asyncio.wait([task])
+    except asyncio.CancelledError:
+        task.cancel()
+        raise
+    finally:
+        if searches.get(user) is task:
+            del searches[user]
+    if task.cancelled():
+        return
+    task.result()
+    user_data.save(user)  # with message to edit
+    logging.info(str(user) + ', ' + message.text + ', found:' + str(find_list.count) + '')
+    if find_list.count == 0:
+        await message.reply('Nothing found...' + (' (timeout: ' + ','.join(find_list.timed_out) + ')' if find_list.timed_out else ''))
+        await state.clear()
 
 @router.callback_query(StateFilter(FindStates.show_list))
 async def inline_kb_answer_callback_handler(query: CallbackQuery, state: FSMContext):
-    await query.answer()
-    find_list = user_data[query.from_user.id]
+    await query.answer()  # before restoring evicted list: it searches again, answer would come too late
+    find_list = await user_data.get(query.from_user.id, query.bot)
+    if find_list is None:
+        await query.bot.send_message(query.from_user.id, 'list is expired')
+        await state.clear()
+        return
     await find_list.handle_callback(query)
     if find_list.selected_index != -1:
         builder = InlineKeyboardBuilder()
@@ -83,49 +203,43 @@ async def inline_kb_answer_callback_handler(query: CallbackQuery, state: FSMCont
 
         await state.set_state(FindStates.select_action)
         await query.bot.send_message(query.from_user.id, find_list.get_selected_str(), reply_markup=builder.as_markup())
+    user_data.save(query.from_user.id)
 
 @router.callback_query(StateFilter(FindStates.select_action))
 async def inline_kb_answer_callback_handler(query: CallbackQuery, state: FSMContext):
     await query.answer(query.data)
-    find_list = user_data[query.from_user.id]
+    find_list = await user_data.get(query.from_user.id, query.bot)
+    if find_list is None or find_list.selected_item is None:
+        await query.bot.send_message(query.from_user.id, 'item is gone')
+        await query.bot.delete_message(chat_id = query.from_user.id, message_id = query.message.message_id)
+        await state.set_state(FindStates.show_list)
+        return
     selected = find_list.selected_item
 
     if query.data == 'download':
         if not selected['Link'] is None:
-            response = requests.get(selected['Link'])
-            if response.status_code == 200:
-                transmission.add_torrent(BytesIO(response.content))
+            content = await torrent_cache.fetch(selected['Link'], jackett.download, selected['InfoHash'])
+            if content:
+                await offload.run(transmission_pool.add_torrent, content, name = 'transmission.add_torrent')
         elif not selected['MagnetUri'] is None:
-            transmission.add_torrent(selected['MagnetUri'])
+            await offload.run(transmission_pool.add_torrent, selected['MagnetUri'], name = 'transmission.add_torrent')
         selected['transmission'] = True
+        start_polling(query.bot)  # new torrent shows up on next fast poll
 
     elif query.data == 'torrserver':
-        try:
-            tree = get_etree(selected['Details'])
-            poster = tree.xpath('//var[@class="postImg postImgAligned img-right"]') # rutracker
-            if len(poster) > 0:
-                selected['Poster'] = poster[0].attrib['title']
-            else:
-                poster = tree.xpath('//table[@id="details"]/tr/td[2]/img')  # rutor
-                if len(poster) > 0:
-                    selected['Poster'] = poster[0].attrib['src']
-                else:
-                    poster = tree.xpath('//table[@id="details"]//img')
-                    if len(poster) > 0:
-                        selected['Poster'] = poster[0].attrib['src']
-
-
-        except Exception as e:
-            logging.info(e)
-
-        res = torrserver.add_item(selected)
+        poster = await posters.resolve(selected['Details'], selected['TrackerId'])
+        if poster:
+            selected['Poster'] = poster
+
+        res = await torrserver.add_item(selected)
         if res:
             selected['torrserver'] = True
  
     elif query.data == 'get_file':
-        response = requests.get(selected['Link'])
-        file = BufferedInputFile(response.content, filename= selected['Title'] + '.torrent')
-        await query.bot.send_document(query.from_user.id, document = file)
+        content = await torrent_cache.fetch(selected['Link'], jackett.download, selected['InfoHash'])
+        if content:
+            file = BufferedInputFile(content, filename= selected['Title'] + '.torrent')
+            await query.bot.send_document(query.from_user.id, document = file)
 
     elif query.data == 'get_magnet':
         await query.bot.send_message(query.from_user.id, selected['MagnetUri'])
@@ -134,5 +248,6 @@ async def inline_kb_answer_callback_handler(query: CallbackQuery, state: FSMCont
         await query.bot.send_message(query.from_user.id, selected['Details'])
  
     await find_list.refresh()
+    user_data.save(query.from_user.id)
     await query.bot.delete_message(chat_id = query.from_user.id, message_id = query.message.message_id)
     await state.set_state(FindStates.show_list)
\ No newline at end of file
@@ -1,18 +1,18 @@
-import psutil
 import os
-from collections import Counter
+import html
+import asyncio
+from datetime import timedelta
 from shutil import rmtree
-from apscheduler.schedulers.asyncio import AsyncIOScheduler
 import logging
 
 from commons.aio_modules import *
 from commons.bot_list_ui import AbstractItemsList
-from commons.utils import datetime, timestamp, sizeof_fmt, get_file_ext, scantree
-from commons.globals import settings, transmission
+from commons.utils import datetime, timestamp, sizeof_fmt
+from commons.globals import settings, transmission_pool, torrents_poller, scheduler, storage
+from commons.offload import offload
+from commons.user_lists import UserLists
 
-user_data = {}
 router = Router()
-scheduler = AsyncIOScheduler()
 
 class TransmissionList(AbstractItemsList):
 
@@ -34,63 +34,73 @@ class TransmissionList(AbstractItemsList):
         super().__init__()
         self.sort_keys = ['date', 'name', 'size', ('is_dir', 'dir'), ('uploadRatio', 'rtx')] 
         self.sort_order = [('date', 0)]
-        self.filter_key = 'status'
+        self.filter_key = ('status', 'instance') if len(transmission_pool) > 1 else 'status'
         self.stats = None
         self.reload_button = True
-        self.reload()
+        self.id_keys = ('hash', 'name', 'instance')
+        self.fsm = None  # FSMContext of owner, auto update only lists on screen
     
     def get_icon(self, item) -> str:
         ext = item['ext'].lower() if item['ext'] else ''
         return (item['is_dir'] and '📁' or '') + (ext in self.ext_icons and self.ext_icons[ext] or '📄')      
 
-    def reload(self):
-        torrents = transmission.get_torrents()
-        attributes = ('id', 'name', 'percentDone', 'status', 'totalSize', 'uploadRatio', 'addedDate')
-        torrents_list = [{ key : getattr(tr, key) for key in attributes } for tr in torrents]
-
-        ext_counter = Counter()
-        torrent_names = set()
-        for i, tr in enumerate(torrents):
-            ext_counter.clear()
-            item = torrents_list[i]
-            item['is_dir'] = len(tr.files()) > 1
-            item['date'] = datetime.fromtimestamp(item.pop('addedDate'))
-            item['size'] = item.pop('totalSize')
-            for file in tr.files():
-                ext_counter[ get_file_ext(file.name) ] += 1
-            ext = ext_counter.most_common()
-            item['ext'] = ext[0][0] if len(ext) else None  # most frequent extension (for directory)
-            item['count'] = ext[0][1] if len(ext) else None  # count for frequent extension (for directory)
-
-            torrent_names.add(item['name'])
-
-        for entry in scantree(settings['download_dir']):
-            if not entry.name in torrent_names:
-                ext_counter.clear()
-                size = 0
-                for file in scantree(entry.path, recursive = True) if entry.is_dir() else [entry]:
-                    ext_counter[ get_file_ext(file.name) ] += 1
-                    size += file.stat().st_size
-                ext = ext_counter.most_common()
-
-                torrents_list.append({
-                    'id' : None,
-                    'uploadRatio': None,
-                    'percentDone' : None,
-                    'status' : 'no torrent',
-                    'name' : entry.name, 
-                    'is_dir': entry.is_dir(),
-                    'date' : datetime.fromtimestamp(entry.stat().st_ctime),
-                    'size' : size,
-                    'ext': ext[0][0] if len(ext) else None,
-                    'count': ext[0][1] if len(ext) else None
-                })
-
-        self.items_list = torrents_list
+    async def reload(self, force = False):
+        self.apply(await torrents_poller.poll() if force else await torrents_poller.get())
+
+    def apply(self, snapshot : tuple):
+        # own copy of shared snapshot to sort and filter
+        self.items_list = list(snapshot)
         self.sort_items()
 
+    def page_items(self) -> list:
+        self.set_page_bounds()
+        return [self.item(i) for i in range(self.from_index, self.to_index)]
+
+    async def prepare_page(self):
+        # file details of torrents on screen only, big packs are not listed on every refresh
+        items = [item for item in self.page_items() if item['id'] and item['ext'] is None and item['files'] != 0]
+        if len(items) > 0:
+            updated = await asyncio.gather(*[
+                offload.run(transmission_pool[instance].snapshot.details, group, name = 'transmission.details')
+                for instance, group in by_instance(items).items()
+            ])
+            self.update_items(updated = [item for group in updated for item in group])
+
+    def is_affected(self, events : list) -> bool:
+        # rows come and go or counters change on any event but progress, progress matters for rows on screen only
+        if any(kind != 'progress' for kind, item in events):
+            return True
+        return any(item['status'] in torrents_poller.active_statuses for item in self.page_items())
+
+    def get_bulk_actions(self) -> list:
+        return [('Start', 'start'), ('Pause', 'pause'), ('Remove', 'remove')]
+
+    async def apply_bulk(self, action : str, items : list):
+        # one rpc for all torrents of instance, instances and files are handled concurrently, only affected rows are updated
+        async def apply(instance, items : list) -> list:
+            ids = [item['id'] for item in items]
+            if action == 'remove':
+                await offload.run(instance.client.remove_torrent, ids, delete_data = True, name = 'transmission.remove_torrent')
+                instance.snapshot.forget(ids)
+                torrents_poller.changed(instance)
+                return []
+            method = instance.client.start_torrent if action == 'start' else instance.client.stop_torrent
+            await offload.run(method, ids, name = 'transmission.' + method.__name__)
+            fetched = await offload.run(instance.snapshot.fetch, ids)
+            torrents_poller.changed(instance)
+            return fetched
+
+        updated = await asyncio.gather(*[
+            apply(transmission_pool[instance], group) for instance, group in by_instance([item for item in items if item['id']]).items()
+        ])
+        if action == 'remove':
+            await asyncio.gather(*[remove_files(item) for item in items if not item['id']])
+            self.update_items(removed = items)
+        else:
+            self.update_items(updated = [item for group in updated for item in group])
+
     def get_item_str(self, i : int) -> str:
-        item = self.items[i]
+        item = self.item(i)
         key_map = {
             'name' : lambda item: item['name'],
             'count' : lambda item: '[' + str(item['count']) + ' *.' + item['ext'] + ']' if item['count'] > 1 else '',
@@ -98,102 +108,225 @@ class TransmissionList(AbstractItemsList):
             'percentDone' : lambda item: '[' + str(round(item['percentDone'] * 100, 2)) + '%]',
             'uploadRatio' : lambda item: '[' + str(round(item['uploadRatio'], 2)).rstrip('0').rstrip('.') + 'x]',
             'status' : lambda item: '[' + item['status'] + ']',
+            **({'instance' : lambda item: '[' + item['instance'] + ']'} if len(transmission_pool) > 1 else {})
         }
         result = ' '.join(key_map[key]( item ) for key in key_map if item[key])     
         return '<b>' + str(i + 1) + '</b>. ' + self.get_icon(item) + result
     
+    def accumulate(self, totals : dict, item):
+        totals['download'] = totals.get('download', 0) + item['size']
+        totals['upload'] = totals.get('upload', 0) + (item['id'] and item['size'] * item['uploadRatio'] or 0)
+
     def get_footer_str(self) -> str:
         stats = {
-            'download' : sum(item['size'] for item in self.items),
-            'upload' : sum( (item['id'] and item['size'] * item['uploadRatio'] or 0) for item in self.items),
-            **psutil.disk_usage(settings['download_dir'])._asdict()
+            'download' : 0,
+            'upload' : 0,
+            **self.get_totals(),
+            **torrents_poller.disk_usage
         }
-        del stats['percent']
         result = ''
         for key in stats.keys():
             result += ('\n' if key == 'total' else '') + key + ': ' + sizeof_fmt( stats[key] ) + ' '
         return '<b>' + result + '</b>'
 
 
+class FilesList(AbstractItemsList):
+    # files of one torrent with progress, torrent is kept by hash: ids of transmission change on its restart
+
+    def __init__(self, torrent_hash : str = None, torrent_name : str = '', instance : str = 'default') -> None:
+        super().__init__()
+        self.torrent_hash = torrent_hash
+        self.torrent_name = torrent_name
+        self.instance = instance
+        self.sort_keys = ['name', 'size', ('percentDone', 'done')]
+        self.sort_order = [('name', 1)]
+        self.filter_key = 'ext'
+        self.items_on_page = 10
+        self.reload_button = True
+        self.id_keys = ('name',)
+
+    @classmethod
+    def from_state(cls, state : dict):
+        return cls(state.get('torrent_hash'), state['torrent_name'], state.get('instance', 'default'))
+
+    def get_state(self) -> dict:
+        return {**super().get_state(), 'torrent_hash': self.torrent_hash, 'torrent_name': self.torrent_name, 'instance': self.instance}
+
+    async def reload(self, force = False):
+        instance = transmission_pool[self.instance]
+        await offload.run(instance.connect, name = 'transmission.connect')  # list restored after restart comes before first poll
+        if self.torrent_hash is None:
+            self.items_list = []  # state saved by torrent id, nothing to rely on
+        else:
+            self.items_list = await offload.run(instance.snapshot.files, self.torrent_hash, name = 'transmission.files')
+        self.sort_items()
+
+    def get_header_str(self) -> str:
+        return '<b>' + html.escape(self.torrent_name) + '</b>\n' + super().get_header_str()
+
+    def get_item_str(self, i : int) -> str:
+        item = self.item(i)
+        name = item['name'][len(self.torrent_name) + 1:] if item['name'].startswith(self.torrent_name + '/') else item['name']
+        return '<b>' + str(i + 1) + '</b>. ' + html.escape(name) + ' [' + sizeof_fmt(item['size']) + '] [' + str(round(item['percentDone'] * 100, 2)) + '%]'
+
+    def text_and_buttons(self) -> dict:
+        content = super().text_and_buttons()
+        content['reply_markup'].inline_keyboard.append([InlineKeyboardButton(text = '⬆', callback_data = 'return')])
+        return content
+
+
+user_data = UserLists('torrents', TransmissionList, storage, **settings.get('user_lists', {}))
+files_data = UserLists('torrent_files', FilesList, storage, **settings.get('user_lists', {}))
+
 class ListStates(StatesGroup):
     show_list = State()
     select_action = State()
+    show_files = State()
+
+
+def by_instance(items : list) -> dict:
+    groups = {}
+    for item in items:
+        groups.setdefault(item['instance'], []).append(item)
+    return groups
+
+async def remove_files(item):
+    path_name = os.path.join(transmission_pool[item['instance']].download_dir, item['name'])
+    if item['is_dir']:
+        await offload.run(rmtree, path_name, ignore_errors = True)
+    else:
+        await offload.run(os.remove, path_name)
 
+def notify_users() -> list:
+    return [user for user, setup in settings['setup'].items() if setup.get('notify')]
 
-async def update_list_auto():
-    for user_id in user_data:
-        state = await user_data[user_id]['state'].get_state()
-        if state == ListStates.show_list:
-            torrents_list = user_data[user_id]['torrents_list']
-            torrents_list.reload()
-            await torrents_list.refresh()
+async def update_list_auto(bot : Bot = None):
+    # one poll per tick, shared by everyone who looks at the list or waits for notifications;
+    # next tick comes sooner while torrents download, later when nothing happens
+    viewers = []
+    for user, torrents_list in user_data.live().items():
+        if torrents_list.fsm is not None and await torrents_list.fsm.get_state() == ListStates.show_list:
+            user_data.touch(user)
+            viewers.append(torrents_list)
+    subscribers = notify_users()
+    if len(viewers) == 0 and len(subscribers) == 0:
+        scheduler.pause_job('update_list_auto')  # resumed by start_polling
+        return
+    events = []
+    try:
+        snapshot = await torrents_poller.poll()
+        events = torrents_poller.take_events()
+        for torrents_list in viewers:
+            if torrents_list.is_affected(events):
+                torrents_list.apply(snapshot)
+                await torrents_list.refresh()
+        if bot is not None:
+            for kind, item in events:
+                if kind == 'completed':
+                    for user in subscribers:
+                        await bot.send_message(user, 'Completed: ' + html.escape(item['name']) + (' [' + item['instance'] + ']' if len(transmission_pool) > 1 else ''))
+    finally:
+        interval = torrents_poller.next_interval(events)
+        scheduler.modify_job('update_list_auto', next_run_time = datetime.now() + timedelta(seconds = interval))
+
+def start_polling(bot : Bot):
+    # (re)starts polling at fast pace: somebody opened the list or subscribed to notifications
+    torrents_poller.speed_up()
+    next_run_time = datetime.now() + timedelta(seconds = torrents_poller.min_interval)
+    job = scheduler.get_job('update_list_auto')
+    if job is None:
+        scheduler.add_job(
+            update_list_auto, trigger = 'interval', seconds = torrents_poller.max_interval,
+            id = 'update_list_auto', kwargs = {'bot': bot}, next_run_time = next_run_time
+        )
+    elif job.next_run_time is None or job.next_run_time.timestamp() > next_run_time.timestamp():
+        scheduler.modify_job('update_list_auto', next_run_time = next_run_time)
 
 
 @router.message(Command('list'))
 async def cmd_list(message: Message, state: FSMContext):
-    global scheduler
-
     torrents_list = TransmissionList()
+    await torrents_list.reload()
     await torrents_list.answer_message(message)
     await state.set_state(ListStates.show_list)
-    user_data[message.from_user.id] = {
-        'torrents_list': torrents_list,
-        'state': state
-    }
-    if not scheduler.running:
-        logging.getLogger('apscheduler.executors.default').setLevel(logging.WARNING)
-        scheduler.add_job(update_list_auto, trigger = 'interval', seconds = 10)
-        scheduler.start()
+    torrents_list.fsm = state
+    user_data[message.from_user.id] = torrents_list
+    start_polling(message.bot)
 
 @router.callback_query(StateFilter(ListStates.show_list))
 async def inline_kb_answer_callback_handler(query: CallbackQuery, state: FSMContext):
+    torrents_list = await user_data.get(query.from_user.id, query.bot)
+    if torrents_list is None:
+        await query.answer('list is expired')
+        await state.clear()
+        return
     await query.answer()
-    torrents_list = user_data[query.from_user.id]['torrents_list']
+    torrents_list.fsm = state
     await torrents_list.handle_callback(query)
     if torrents_list.selected_index != -1:
         builder = InlineKeyboardBuilder()
         selected = torrents_list.selected_item
 
         text_and_data = [('Remove', 'remove')]
-        if 'id' in selected:
+        if selected['id']:
             if selected['status'] == 'stopped': text_and_data.append( ('Start', 'start')  )
             if selected['status'] in ['downloading', 'seeding']: text_and_data.append( ('Pause', 'pause')  )
+            if selected['files'] != 0: text_and_data.append( ('Files', 'files')  )
         text_and_data.append( ('⬆', 'return') )
         row_btns = (InlineKeyboardButton(text = text, callback_data = data) for text, data in text_and_data)
         builder.row(*row_btns)
 
         await state.set_state(ListStates.select_action)
         await query.bot.send_message(query.from_user.id, torrents_list.get_selected_str(), reply_markup = builder.as_markup() )
+    user_data.save(query.from_user.id)
+    start_polling(query.bot)
 
 @router.callback_query(StateFilter(ListStates.select_action))
 async def inline_kb_answer_callback_handler(query: CallbackQuery, state: FSMContext):
+    torrents_list = await user_data.get(query.from_user.id, query.bot)
+    if torrents_list is None or torrents_list.selected_item is None:
+        await query.answer('item is gone')
+        await query.bot.delete_message(chat_id = query.from_user.id, message_id = query.message.message_id)
+        await state.set_state(ListStates.show_list)
+        return
     await query.answer()
-    torrents_list = user_data[query.from_user.id]['torrents_list']
+    torrents_list.fsm = state
     selected = torrents_list.selected_item
 
-    if query.data == 'remove':
-        if selected['id']: # this is a torrent
-            transmission.remove_torrent(selected['id'], delete_data = True)
-        else: # remove just file(s)
-            path_name = os.path.join(settings['download_dir'], selected['name'] )
-            if selected['is_dir']:
-                rmtree(path_name, ignore_errors = True)
-            else:
-                os.remove(path_name)
-        await query.answer('remove')
-
-    elif query.data == 'pause':
-        transmission.stop_torrent(selected['id'])    
-        await query.answer('pause')
-
-    elif query.data == 'start':
-        transmission.start_torrent(selected['id'])
-        await query.answer('start')
+    if query.data in ['remove', 'pause', 'start']:
+        await torrents_list.apply_bulk(query.data, [selected])
+        await query.answer(query.data)
+
+    elif query.data == 'files':
+        files_list = FilesList(selected['hash'], selected['name'], selected['instance'])
+        await files_list.reload()
+        await files_list.answer_message(query.message)
+        files_data[query.from_user.id] = files_list
+        await query.bot.delete_message(chat_id = query.from_user.id, message_id = query.message.message_id)
+        await state.set_state(ListStates.show_files)
+        return
 
     elif query.data == 'return':
         await query.answer('return')
-        
-    torrents_list.reload()
+        await torrents_list.reload()
+
     await torrents_list.refresh()
+    user_data.save(query.from_user.id)
     await query.bot.delete_message(chat_id = query.from_user.id, message_id = query.message.message_id)
     await state.set_state(ListStates.show_list)
+    start_polling(query.bot)
+
+@router.callback_query(StateFilter(ListStates.show_files))
+async def inline_kb_answer_callback_handler(query: CallbackQuery, state: FSMContext):
+    files_list = await files_data.get(query.from_user.id, query.bot)
+    if files_list is None or query.data == 'return':
+        await query.answer()
+        await query.bot.delete_message(chat_id = query.from_user.id, message_id = query.message.message_id)
+        await state.set_state(ListStates.show_list)
+        start_polling(query.bot)
+        return
+    await query.answer()
+    await files_list.handle_callback(query)
+    files_list.selected_index = -1  # nothing to do with single file
+    files_list.selected_item = None
+    files_data.save(query.from_user.id)
@@ -0,0 +1,16 @@
+import unittest
+from commons.metrics import Metrics
+
+class MetricsTest(unittest.TestCase):
+
+    def test_label_values_are_escaped(self):
+        metrics = Metrics()
+        with metrics.timer('handler', 'a"b\\c\nd'):
+            pass
+        lines = metrics.prometheus().splitlines()
+        self.assertIn('bot_handler_errors_total{name="a\\"b\\\\c\\nd"} 0', lines)
+        self.assertTrue(all(line.startswith(('#', 'bot_')) for line in lines))
+
+
+if __name__ == '__main__':
+    unittest.main()
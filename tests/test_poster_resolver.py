@@ -0,0 +1,37 @@
+import unittest
+from commons.poster_resolver import PosterResolver
+
+class ChunkedHttp():
+    # serves page in chunks of 'size' bytes
+    def __init__(self, page : bytes, size : int = 1) -> None:
+        self.page = page
+        self.size = size
+
+    async def stream(self, url : str):
+        for start in range(0, len(self.page), self.size):
+            yield self.page[start:start + self.size]
+
+
+class PosterResolverTest(unittest.IsolatedAsyncioTestCase):
+
+    async def resolve(self, page : bytes, tracker_id : str):
+        resolver = PosterResolver(ChunkedHttp(page), path = ':memory:')
+        return await resolver.resolve('http://tracker/details', tracker_id)
+
+    async def test_poster_is_last_element(self):
+        page = b'<html><body><table id="details"><tr><td><img src="http://poster/1.jpg">'
+        self.assertEqual(await self.resolve(page, 'rutor'), 'http://poster/1.jpg')
+
+    async def test_rutracker_aligned_poster_only(self):
+        page = (
+            b'<html><body><var class="postImg" title="http://poster/other.jpg"></var>'
+            b'<var class="postImg postImgAligned img-right" title="http://poster/2.jpg"></var>'
+        )
+        self.assertEqual(await self.resolve(page, 'rutracker'), 'http://poster/2.jpg')
+
+    async def test_no_poster(self):
+        self.assertIsNone(await self.resolve(b'<html><body><p>nothing</p></body></html>', 'rutor'))
+
+
+if __name__ == '__main__':
+    unittest.main()